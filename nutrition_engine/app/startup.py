@@ -1,22 +1,33 @@
 """Load all artifacts at startup. Zero disk reads at request time."""
 
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 from app.config import LAYER2_ARTIFACTS, LAYER3_ARTIFACTS
 
 logger = logging.getLogger(__name__)
 
 
-def startup(app=None):
-    """Load Layer 2 and Layer 3 artifacts. Call once per worker at process start."""
+def _load_layer2() -> None:
     logger.info("Loading Layer 2 calibration tables from %s", LAYER2_ARTIFACTS)
     from layers import layer2
     layer2.load_calibration_tables(str(LAYER2_ARTIFACTS))
 
+
+def _load_layer3() -> None:
     logger.info("Loading Layer 3 embeddings from %s", LAYER3_ARTIFACTS)
     from layers import layer3
     layer3.load_embeddings(str(LAYER3_ARTIFACTS))
 
+
+def startup(app=None):
+    """Load Layer 2 and Layer 3 artifacts. Call once per worker at process start."""
+    # L2 and L3 artifacts are independent; read them concurrently so file I/O overlaps
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="artifact-load") as pool:
+        futures = [pool.submit(_load_layer2), pool.submit(_load_layer3)]
+        for future in futures:
+            future.result()
+
     from app.cache import warmup_cache
     warmup_cache()
 
@@ -1,6 +1,7 @@
 """NLP-based ingredient parser."""
 
 import re
+import sys
 from fractions import Fraction
 from typing import Optional, Tuple, List, Dict
 from Levenshtein import distance as levenshtein_distance
@@ -20,6 +21,15 @@ except OSError:
     nlp = None
 
 
+# Common descriptors stripped from ingredient names, fused into one pass
+_DESCRIPTOR_RE = re.compile(
+    r"\b(?:fresh|dried|frozen|canned|raw|cooked|chopped|diced|sliced|minced|"
+    r"ground|shredded|peeled|seeded|washed|trimmed)\b",
+    re.IGNORECASE,
+)
+_PARENTHETICAL_RE = re.compile(r"\([^)]*\)")
+
+
 class IngredientParser:
     
     VOLUME_UNITS = {
@@ -92,26 +102,48 @@ class IngredientParser:
         "a": 1, "an": 1, "half": 0.5, "quarter": 0.25, "third": 0.333,
     }
     
+    # Intern unit keys (and canonical count units) so lookups with the interned unit
+    # strings returned by the extractors compare by identity before hashing
+    VOLUME_UNITS = {sys.intern(k): v for k, v in VOLUME_UNITS.items()}
+    WEIGHT_UNITS = {sys.intern(k): v for k, v in WEIGHT_UNITS.items()}
+    COUNT_UNITS = {sys.intern(k): sys.intern(v) for k, v in COUNT_UNITS.items()}
+    
+    # Single-pass tokenizer for the common "<quantity> <unit> <name>" shape. Alternatives
+    # are listed in the same order the step-by-step extractors try them, so a match here
+    # yields exactly what _extract_quantity + _extract_unit would.
+    _QUANTITY_UNIT_RE = re.compile(
+        r"^(?P<quantity>\d+\.?\d*|" + "|".join(WORD_TO_NUMBER) + r")\s+"
+        r"(?P<unit>" + "|".join(map(re.escape, [*WEIGHT_UNITS, *VOLUME_UNITS, *COUNT_UNITS])) + r")\b\s*"
+        r"(?P<name>.+)$",
+        re.IGNORECASE,
+    )
+    
     def __init__(self, db: Session):
         """Initialize parser with database session."""
         self.db = db
         self._ingredient_cache: Optional[Dict] = None
+        self._fuzzy_corpus: Optional[List[Tuple[str, int, Ingredient, float]]] = None
+        self._grams_per_unit_cache: Dict[Tuple[int, str], float] = {}
     
     def parse(self, ingredient_text: str) -> ParsedIngredient:        
         warnings = []
         
-        # Extract quantity
-        quantity, text_after_quantity = self._extract_quantity(ingredient_text)
-        if quantity is None:
-            quantity = 1.0
-            warnings.append("No quantity found, assuming 1")
-            text_after_quantity = ingredient_text
-        
-        # Extract unit
-        unit, ingredient_name = self._extract_unit(text_after_quantity)
-        if not unit:
-            unit = "piece"
-            warnings.append("No unit found, assuming piece")
+        tokens = self._tokenize(ingredient_text)
+        if tokens is not None:
+            quantity, unit, ingredient_name = tokens
+        else:
+            # Extract quantity
+            quantity, text_after_quantity = self._extract_quantity(ingredient_text)
+            if quantity is None:
+                quantity = 1.0
+                warnings.append("No quantity found, assuming 1")
+                text_after_quantity = ingredient_text
+            
+            # Extract unit
+            unit, ingredient_name = self._extract_unit(text_after_quantity)
+            if not unit:
+                unit = "piece"
+                warnings.append("No unit found, assuming piece")
         
         # Clean ingredient name
         ingredient_name = self._clean_ingredient_name(ingredient_name)
@@ -141,6 +173,22 @@ class IngredientParser:
             warnings=warnings
         )
     
+    def _tokenize(self, text: str) -> Optional[Tuple[float, str, str]]:
+        """Split "<quantity> <unit> <name>" in one regex match; None if the text has another shape."""
+        match = self._QUANTITY_UNIT_RE.match(text.strip())
+        if not match:
+            return None
+        
+        quantity_text = match.group("quantity").lower()
+        if quantity_text[0].isdigit():
+            quantity = float(quantity_text)
+        else:
+            quantity = self.WORD_TO_NUMBER[quantity_text]
+        
+        unit = match.group("unit").lower()
+        unit = sys.intern(self.COUNT_UNITS.get(unit, unit))
+        return quantity, unit, match.group("name").lower()
+    
     def _extract_quantity(self, text: str) -> Tuple[Optional[float], str]:
         """Extract quantity from ingredient text."""
         text = text.strip()
@@ -205,26 +253,14 @@ class IngredientParser:
     
     def _clean_ingredient_name(self, name: str) -> str:
         """Clean and normalize ingredient name."""
-        name = name.strip()
-        
         # Remove common descriptors
-        descriptors = [
-            r"\bfresh\b", r"\bdried\b", r"\bfrozen\b", r"\bcanned\b",
-            r"\braw\b", r"\bcooked\b", r"\bchopped\b", r"\bdiced\b",
-            r"\bsliced\b", r"\bminced\b", r"\bground\b", r"\bshredded\b",
-            r"\bpeeled\b", r"\bseeded\b", r"\bwashed\b", r"\btrimmed\b",
-        ]
-        
-        for descriptor in descriptors:
-            name = re.sub(descriptor, "", name, flags=re.IGNORECASE)
+        name = _DESCRIPTOR_RE.sub("", name)
         
         # Remove parenthetical notes
-        name = re.sub(r"\([^)]*\)", "", name)
-        
-        # Clean whitespace
-        name = re.sub(r"\s+", " ", name).strip()
+        name = _PARENTHETICAL_RE.sub("", name)
         
-        return name
+        # Clean whitespace (split() collapses runs and trims both ends)
+        return " ".join(name.split())
     
     def _match_ingredient(self, ingredient_name: str) -> Tuple[Optional[Ingredient], float]:
         """Match ingredient name to database using fuzzy matching."""
@@ -251,30 +287,27 @@ class IngredientParser:
             return best_synonym.ingredient, best_synonym.confidence
         
         # Fuzzy matching
+        if self._fuzzy_corpus is None:
+            self._build_fuzzy_corpus()
+        
         best_match = None
         best_score = 0.0
-        
-        # Get all ingredients and synonyms for fuzzy matching
-        ingredients = self.db.query(Ingredient).all()
-        
-        for ingredient in ingredients:
-            dist = levenshtein_distance(ingredient_name_lower, ingredient.name.lower())
-            max_len = max(len(ingredient_name_lower), len(ingredient.name))
-            similarity = 1.0 - (dist / max_len) if max_len > 0 else 0.0
+        query_len = len(ingredient_name_lower)
+        
+        for candidate, candidate_len, ingredient, weight in self._fuzzy_corpus:
+            longer = query_len if query_len > candidate_len else candidate_len
+            # Levenshtein distance is at least the length difference, so similarity
+            # can be at most shorter/longer; skip the DP when that can't beat best_score
+            if query_len + candidate_len - longer <= best_score * longer:
+                continue
+            
+            dist = levenshtein_distance(ingredient_name_lower, candidate)
+            similarity = 1.0 - (dist / longer)
             
             if similarity > best_score:
-                best_score = similarity
+                # Synonym matches are discounted by their confidence (1.0 for names)
+                best_score = similarity * weight
                 best_match = ingredient
-            
-            # Check synonyms
-            for synonym in ingredient.synonyms:
-                dist = levenshtein_distance(ingredient_name_lower, synonym.synonym.lower())
-                max_len = max(len(ingredient_name_lower), len(synonym.synonym))
-                similarity = 1.0 - (dist / max_len) if max_len > 0 else 0.0
-                
-                if similarity > best_score:
-                    best_score = similarity * synonym.confidence
-                    best_match = ingredient
         
         return best_match, best_score
     
@@ -284,7 +317,27 @@ class IngredientParser:
         ingredients = self.db.query(Ingredient).all()
         
         for ingredient in ingredients:
-            self._ingredient_cache[ingredient.name.lower()] = ingredient
+            self._ingredient_cache[sys.intern(ingredient.name.lower())] = ingredient
+    
+    def _build_fuzzy_corpus(self) -> None:
+        """
+        Build the fuzzy-match corpus once: (lowercased text, length, ingredient, weight).
+        
+        Names and synonyms are lowercased and measured here so the per-query
+        loop does no string allocation. Weight is 1.0 for ingredient names and
+        the synonym confidence for synonyms.
+        """
+        corpus = []
+        ingredients = self.db.query(Ingredient).all()
+        
+        for ingredient in ingredients:
+            name_lower = sys.intern(ingredient.name.lower())
+            corpus.append((name_lower, len(name_lower), ingredient, 1.0))
+            for synonym in ingredient.synonyms:
+                synonym_lower = synonym.synonym.lower()
+                corpus.append((synonym_lower, len(synonym_lower), ingredient, synonym.confidence))
+        
+        self._fuzzy_corpus = corpus
     
     def _convert_to_grams(
         self, 
@@ -294,13 +347,32 @@ class IngredientParser:
         matched_ingredient: Optional[Ingredient]
     ) -> float:
         """Convert quantity and unit to grams."""
+        if not (matched_ingredient and matched_ingredient.id):
+            return quantity * self._grams_per_unit(unit, ingredient_name, None)
+        
+        # The per-unit factor depends only on (ingredient, unit); cache it so repeated
+        # units ("1 tbsp", "2 tbsp") skip the conversion query
+        key = (matched_ingredient.id, unit)
+        grams_per_unit = self._grams_per_unit_cache.get(key)
+        if grams_per_unit is None:
+            grams_per_unit = self._grams_per_unit(unit, ingredient_name, matched_ingredient)
+            self._grams_per_unit_cache[key] = grams_per_unit
+        return quantity * grams_per_unit
+    
+    def _grams_per_unit(
+        self,
+        unit: str,
+        ingredient_name: str,
+        matched_ingredient: Optional[Ingredient]
+    ) -> float:
+        """Grams in one unit of the ingredient (0.0 for unknown units)."""
         # If already in weight units, convert directly
         if unit in self.WEIGHT_UNITS:
-            return quantity * self.WEIGHT_UNITS[unit]
+            return self.WEIGHT_UNITS[unit]
         
         # If volume unit, need density
         if unit in self.VOLUME_UNITS:
-            ml = quantity * self.VOLUME_UNITS[unit]
+            ml = self.VOLUME_UNITS[unit]
             
             # Check for specific ingredient conversion
             if matched_ingredient and matched_ingredient.id:
@@ -310,7 +382,7 @@ class IngredientParser:
                 ).first()
                 
                 if conversion:
-                    return quantity * conversion.grams
+                    return conversion.grams
             
             # Use density if available
             if matched_ingredient and matched_ingredient.density_g_per_ml:
@@ -331,12 +403,12 @@ class IngredientParser:
                 ).first()
                 
                 if conversion:
-                    return quantity * conversion.grams
+                    return conversion.grams
             
             logger.warning(
                 f"No conversion for {unit} of {ingredient_name}, using 100g default"
             )
-            return quantity * 100.0
+            return 100.0
         
         logger.error(f"Unknown unit: {unit}")
         return 0.0
@@ -1,6 +1,8 @@
 """Sanity check and validation for nutrient calculations."""
 
-from typing import List, Optional
+from typing import Dict, List, Optional
+
+import numpy as np
 
 from layer1_app.core.logging import logger
 from layer1_app.schemas.recipe import NutrientTotals, ValidationResult, ParsedIngredient
@@ -19,6 +21,9 @@ class NutrientValidator:
     MASS_RATIO_THRESHOLD = 1.5  # Nutrients shouldn't exceed 150% of total mass
     LOW_CONFIDENCE_THRESHOLD = 0.7
     
+    # Column order for validate_batch input arrays
+    BATCH_COLUMNS = ("protein_g", "carbohydrates_g", "fat_g", "fiber_g", "calories")
+    
     @staticmethod
     def validate(
         totals: NutrientTotals,
@@ -95,6 +100,73 @@ class NutrientValidator:
             errors=errors
         )
     
+    @staticmethod
+    def stack_totals(totals_list: List[NutrientTotals]) -> np.ndarray:
+        """
+        Stack NutrientTotals into an (N, 5) float64 array in BATCH_COLUMNS order.
+        
+        Missing macros become 0 (as in the scalar checks); missing calories become NaN.
+        """
+        arr = np.empty((len(totals_list), len(NutrientValidator.BATCH_COLUMNS)), dtype=np.float64)
+        for i, t in enumerate(totals_list):
+            arr[i, 0] = t.protein_g or 0.0
+            arr[i, 1] = t.carbohydrates_g or 0.0
+            arr[i, 2] = t.fat_g or 0.0
+            arr[i, 3] = t.fiber_g or 0.0
+            arr[i, 4] = np.nan if t.calories is None else t.calories
+        return arr
+    
+    @staticmethod
+    def validate_batch(totals: np.ndarray, masses: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Run the calorie and mass checks over many recipes at once.
+        
+        Args:
+            totals: (N, 5) array in BATCH_COLUMNS order (see stack_totals);
+                NaN calories means "no calorie data"
+            masses: (N,) total mass in grams per recipe
+        
+        Returns:
+            Dict of per-row arrays: calorie_check_passed, mass_check_passed,
+            macros_calories and delta_percent (NaN where the check did not apply)
+        """
+        # float64 and the scalar checks' operation order, so rows at a threshold
+        # pass or fail exactly as they do in validate()
+        arr = np.asarray(totals, dtype=np.float64)
+        mass = np.asarray(masses, dtype=np.float64)
+        protein, carbs, fat, fiber, calories = arr.T
+        
+        # Calorie check (4/4/9 rule)
+        macros_calories = (
+            protein * NutrientValidator.PROTEIN_CALORIES_PER_G
+            + carbs * NutrientValidator.CARB_CALORIES_PER_G
+            + fat * NutrientValidator.FAT_CALORIES_PER_G
+        )
+        has_calories = ~np.isnan(calories)
+        has_macros = macros_calories != 0
+        applies = has_calories & has_macros
+        safe_macros = np.where(has_macros, macros_calories, 1.0)
+        delta = np.abs(calories - macros_calories) / safe_macros
+        delta_percent = np.where(applies, delta * 100, np.nan)
+        calorie_passed = np.where(
+            applies,
+            delta <= NutrientValidator.CALORIE_DELTA_THRESHOLD,
+            ~has_calories,
+        )
+        
+        # Mass check
+        macro_sum = protein + carbs + fat + fiber
+        has_mass = mass != 0
+        ratio = macro_sum / np.where(has_mass, mass, 1.0)
+        mass_passed = ~has_mass | (ratio <= NutrientValidator.MASS_RATIO_THRESHOLD)
+        
+        return {
+            "calorie_check_passed": calorie_passed,
+            "mass_check_passed": mass_passed,
+            "macros_calories": macros_calories,
+            "delta_percent": delta_percent,
+        }
+    
     @staticmethod
     def _check_calories(totals: NutrientTotals) -> dict:
         """
@@ -190,17 +262,15 @@ class NutrientValidator:
     def _check_missing_nutrients(totals: NutrientTotals) -> List[str]:
         """Check for important missing nutrients."""
         missing = []
-        
-        important_nutrients = {
-            "protein_g": "Protein",
-            "carbohydrates_g": "Carbohydrates",
-            "fat_g": "Fat",
-            "calories": "Calories"
-        }
-        
-        for field, name in important_nutrients.items():
-            value = getattr(totals, field, None)
-            if value is None or value == 0:
-                missing.append(name)
-        
+
+        # Fields are fixed on NutrientTotals; falsy covers both None and 0
+        if not totals.protein_g:
+            missing.append("Protein")
+        if not totals.carbohydrates_g:
+            missing.append("Carbohydrates")
+        if not totals.fat_g:
+            missing.append("Fat")
+        if not totals.calories:
+            missing.append("Calories")
+
         return missing
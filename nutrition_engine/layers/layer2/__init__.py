@@ -7,6 +7,9 @@ from typing import Any, Dict
 logger = logging.getLogger(__name__)
 
 _loaded = False
+# Bound once (at load or first call) so calibrate() skips the import machinery per request
+_calibrate_impl = None
+_MACRO_KEYS = frozenset(("calories", "fat", "carbs", "protein", "sodium"))
 
 
 def _build_baseline_estimate(baseline_estimate: Dict[str, Any]) -> Dict[str, Any]:
@@ -30,6 +33,24 @@ def _build_baseline_estimate(baseline_estimate: Dict[str, Any]) -> Dict[str, Any
     }
 
 
+def _bind_calibrate() -> None:
+    """Resolve the real inference entry point once and keep it at module scope."""
+    global _calibrate_impl
+    from layers.layer2.layer2.inference import calibrate as _calibrate_impl
+
+
+def _read_model(model_file: Path) -> Any:
+    """Load the trained calibration model. Startup only; never on the request path."""
+    import sys
+    # So pickle can resolve "layer2.xxx" to layers.layer2.layer2
+    _layer2_dir = Path(__file__).resolve().parent
+    if str(_layer2_dir) not in sys.path:
+        sys.path.insert(0, str(_layer2_dir))
+    from layers.layer2.layer2.calibration_model import load_model
+    # Ratio buffers are memory-mapped read-only, shared across worker processes
+    return load_model(str(model_file))
+
+
 def load_calibration_tables(artifacts_path: str) -> None:
     """Load Layer 2 model from artifacts (trained_model.pkl). Call once at startup."""
     global _loaded
@@ -37,23 +58,19 @@ def load_calibration_tables(artifacts_path: str) -> None:
     model_file = path / "trained_model.pkl"
     if not model_file.exists():
         logger.warning("Layer 2: no trained_model.pkl at %s; calibration will use fallback", path)
+        _bind_calibrate()
         _loaded = True
         return
     try:
-        import pickle
-        import sys
-        # So pickle can resolve "layer2.xxx" to layers.layer2.layer2
-        _layer2_dir = Path(__file__).resolve().parent
-        if str(_layer2_dir) not in sys.path:
-            sys.path.insert(0, str(_layer2_dir))
         from layers.layer2.layer2.inference import set_model
-        with open(model_file, "rb") as f:
-            model = pickle.load(f)
+        model = _read_model(model_file)
         set_model(model)
+        _bind_calibrate()
         _loaded = True
         logger.info("Layer 2: loaded calibration model from %s", model_file)
     except Exception as e:
         logger.warning("Layer 2: failed to load model from %s: %s; using fallback", model_file, e)
+        _bind_calibrate()
         _loaded = True
 
 
@@ -62,15 +79,27 @@ def calibrate(
     restaurant_metadata: Dict[str, Any],
 ) -> Dict[str, Any]:
     """Calibrate baseline using restaurant/price. Returns macros, layer2_confidence, applied_adjustments."""
-    from layers.layer2.layer2.inference import calibrate as _calibrate
+    if _calibrate_impl is None:
+        # Not loaded via startup (e.g. scripts/tests); resolve once and reuse
+        _bind_calibrate()
 
     base = _build_baseline_estimate(baseline_estimate)
-    result = _calibrate(baseline_estimate=base, restaurant_metadata=restaurant_metadata)
+    result = _calibrate_impl(baseline_estimate=base, restaurant_metadata=restaurant_metadata)
 
     adjusted = result.get("adjusted_macros", result.get("macros", {}))
     conf_dict = result.get("confidence", {})
     if isinstance(conf_dict, dict) and conf_dict:
-        layer2_confidence = sum(conf_dict.values()) / len(conf_dict)
+        if conf_dict.keys() == _MACRO_KEYS:
+            # Layer 2 scores exactly these five macros; average without building views
+            layer2_confidence = (
+                conf_dict["calories"]
+                + conf_dict["fat"]
+                + conf_dict["carbs"]
+                + conf_dict["protein"]
+                + conf_dict["sodium"]
+            ) / 5
+        else:
+            layer2_confidence = sum(conf_dict.values()) / len(conf_dict)
     else:
         layer2_confidence = 1.0
 
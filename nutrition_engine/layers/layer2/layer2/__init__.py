@@ -4,17 +4,21 @@ Layer 2: Restaurant Calibration Engine
 This package learns restaurant-specific empirical adjustments to Layer 1 baseline estimates.
 """
 
-from .inference import calibrate, set_model, get_model
-from .calibration_model import CalibrationModel
-from .feature_extraction import extract_features
+from .inference import calibrate, calibrate_batch, set_model, get_model
+from .calibration_model import CalibrationModel, load_model, save_model
+from .feature_extraction import extract_features, extract_features_batch
 from .confidence import confidence_score
 
 __all__ = [
     'calibrate',
+    'calibrate_batch',
     'set_model',
     'get_model',
     'CalibrationModel',
+    'load_model',
+    'save_model',
     'extract_features',
+    'extract_features_batch',
     'confidence_score',
 ]
 
@@ -3,57 +3,27 @@ Calibration model that learns multipliers from restaurant truth data.
 Uses robust statistics (median ratios, trimmed means).
 """
 
-try:
-    import numpy as np
-except ImportError:
-    # Fallback if numpy not available
-    class np:
-        @staticmethod
-        def array(x):
-            return list(x)
-        @staticmethod
-        def mean(x):
-            return sum(x) / len(x) if len(x) > 0 else 0
-        @staticmethod
-        def median(x):
-            sorted_x = sorted(x)
-            n = len(sorted_x)
-            if n == 0:
-                return 0
-            if n % 2 == 0:
-                return (sorted_x[n//2 - 1] + sorted_x[n//2]) / 2
-            return sorted_x[n//2]
-        @staticmethod
-        def std(x):
-            if len(x) == 0:
-                return 0
-            mean = np.mean(x)
-            return (sum((xi - mean) ** 2 for xi in x) / len(x)) ** 0.5
-        @staticmethod
-        def var(x):
-            if len(x) == 0:
-                return 0
-            mean = np.mean(x)
-            return sum((xi - mean) ** 2 for xi in x) / len(x)
-        @staticmethod
-        def sort(x):
-            return sorted(x)
-        @staticmethod
-        def abs(x):
-            return abs(x)
-        @staticmethod
-        def clip(x, min_val, max_val):
-            return max(min_val, min(max_val, x))
-
+import math
+import os
+import pickle
+import tempfile
+from array import array
 from typing import Dict, List, Optional, Tuple
 from collections import defaultdict
+from operator import itemgetter
+
+import numpy as np
+
 from .schemas import FeatureVector, RestaurantTruth, BaselineEstimate
+from .feature_extraction import extract_features
 from .config import (
     DEFAULT_MULTIPLIERS,
     MIN_SAMPLES_FOR_CONFIDENCE,
     TRIMMED_MEAN_PERCENT,
     MEDIAN_FALLBACK_THRESHOLD,
     FALLBACK_ORDER,
+    MACROS,
+    MACRO_INDEX,
 )
 
 
@@ -68,34 +38,174 @@ def _defaultdict_int():
     return defaultdict(int)
 
 
+# Feature -> bucket key for each fallback level ("default" is handled by the caller)
+_LEVEL_KEY_FNS = {
+    "restaurant": lambda f: f.restaurant,
+    "cuisine": lambda f: f.cuisine,
+    # Use first cooking method
+    "cooking_method": lambda f: f.cooking_methods[0] if f.cooking_methods else None,
+    "sauce_level": lambda f: f.sauce_level,
+    "portion_class": lambda f: f.portion_class,
+    "oil_intensity": lambda f: f.oil_intensity,
+    "processing_level": lambda f: f.processing_level,
+}
+_KEY_EXTRACTORS = tuple(
+    (level, _LEVEL_KEY_FNS[level]) for level in FALLBACK_ORDER if level in _LEVEL_KEY_FNS
+)
+
+
+def _mean_std(arr: "np.ndarray") -> Tuple[float, float]:
+    """
+    Mean and population std of a non-empty float64 array.
+    
+    The mean is taken once and its deviations reused, rather than letting
+    np.mean / np.var / np.std each recompute the mean.
+    """
+    mean = float(arr.mean())
+    dev = arr - mean
+    return mean, math.sqrt(float(dev.dot(dev)) / arr.size)
+
+
+def _median_fast(arr: "np.ndarray") -> float:
+    """
+    Median of a non-empty float64 array by selection rather than a full sort.
+    
+    np.partition works on a copy, so read-only views (e.g. _RatioBuffer rows)
+    are fine as input.
+    """
+    n = arr.size
+    mid = n // 2
+    if n & 1:
+        return float(np.partition(arr, mid)[mid])
+    parted = np.partition(arr, (mid - 1, mid))
+    return float(0.5 * (parted[mid - 1] + parted[mid]))
+
+
+def _robust_multiplier_kernel(arr: "np.ndarray") -> float:
+    """
+    Outlier filter + median / trimmed mean over a non-empty float64 array.
+    
+    Both the median and the trimmed mean only need order statistics, so they
+    partition (O(n)) rather than sorting.
+    """
+    # Remove outliers (beyond 3 standard deviations)
+    mean, std = _mean_std(arr)
+    if std > 0:
+        mask = np.abs(arr - mean) <= 3 * std
+        # Only use filtered if we have any left; skip the copy if nothing is dropped
+        if mask.any() and not mask.all():
+            arr = arr[mask]
+    
+    n = arr.size
+    
+    if n < MEDIAN_FALLBACK_THRESHOLD:
+        # Use median for small samples
+        return _median_fast(arr)
+    
+    # Use trimmed mean for larger samples
+    trim_count = int(n * TRIMMED_MEAN_PERCENT)
+    if trim_count > 0 and n > trim_count * 2:
+        parted = np.partition(arr, (trim_count, n - trim_count - 1))
+        return float(parted[trim_count:n - trim_count].mean())
+    
+    return float(arr.mean())
+
+
+class _RatioBuffer:
+    """
+    Ratios observed for one (level, key) bucket, stored column-wise.
+    
+    ``data[macro_idx, :counts[macro_idx]]`` holds the ratios for that macro.
+    Capacity doubles when a row fills, so repeated extends are amortized and
+    reads are zero-copy views.
+    """
+    
+    __slots__ = ("data", "counts")
+    
+    def __init__(self, capacity: int = 8):
+        self.data = np.empty((len(MACROS), capacity), dtype=np.float64)
+        self.counts = [0] * len(MACROS)
+    
+    def _reserve(self, size: int) -> None:
+        cap = self.data.shape[1]
+        # Buffers memory-mapped by load_model are read-only; copy on first write
+        if size <= cap and self.data.flags.writeable:
+            return
+        new_cap = max(cap, 1)
+        while new_cap < size:
+            new_cap *= 2
+        grown = np.empty((self.data.shape[0], new_cap), dtype=np.float64)
+        grown[:, :cap] = self.data
+        self.data = grown
+    
+    def extend(self, macro_idx: int, values) -> None:
+        """Append a block of ratios (any float64 buffer or array) in one copy."""
+        values = np.frombuffer(values, dtype=np.float64) if isinstance(values, array) else values
+        n = self.counts[macro_idx]
+        end = n + len(values)
+        self._reserve(end)
+        self.data[macro_idx, n:end] = values
+        self.counts[macro_idx] = end
+    
+    def ratios(self, macro_idx: int) -> "np.ndarray":
+        return self.data[macro_idx, :self.counts[macro_idx]]
+    
+    def __getstate__(self):
+        # Drop unused capacity from pickles; a full buffer is already
+        # contiguous and goes out as-is instead of through a copy
+        return np.ascontiguousarray(self.data[:, :max(self.counts)]), self.counts
+    
+    def __setstate__(self, state):
+        self.data, self.counts = state
+
+
+_get_macros = itemgetter(*MACROS)
+
+
+def _macro_matrix(records: List[Dict]) -> np.ndarray:
+    """(N, 5) float64 values in MACROS order; absent macros are 0."""
+    try:
+        # One C-level lookup of all five macros per record
+        rows = [_get_macros(record) for record in records]
+    except KeyError:
+        rows = [[record.get(m, 0.0) for m in MACROS] for record in records]
+    return np.array(rows, dtype=np.float64)
+
+
 class CalibrationModel:
     """
     Learns restaurant-specific multipliers from truth data.
     """
     
     def __init__(self):
-        # Multiplier storage: level -> macro -> list of ratios
-        # Using helper functions instead of lambdas for pickle compatibility
-        self.multipliers = {
-            "restaurant": defaultdict(_defaultdict_list),
-            "cuisine": defaultdict(_defaultdict_list),
-            "cooking_method": defaultdict(_defaultdict_list),
-            "sauce_level": defaultdict(_defaultdict_list),
-            "portion_class": defaultdict(_defaultdict_list),
-            "oil_intensity": defaultdict(_defaultdict_list),
-            "processing_level": defaultdict(_defaultdict_list),
-        }
-        
-        # Sample counts for confidence
-        self.sample_counts = {
-            "restaurant": defaultdict(_defaultdict_int),
-            "cuisine": defaultdict(_defaultdict_int),
-            "cooking_method": defaultdict(_defaultdict_int),
-            "sauce_level": defaultdict(_defaultdict_int),
-            "portion_class": defaultdict(_defaultdict_int),
-            "oil_intensity": defaultdict(_defaultdict_int),
-            "processing_level": defaultdict(_defaultdict_int),
-        }
+        # Ratio storage: (level, key) -> per-macro ratio arrays; sample counts
+        # are the per-macro fill counts of each buffer
+        self._store: Dict[Tuple[str, str], _RatioBuffer] = {}
+        # (level, key) -> macro -> robust multiplier, filled by finalize()
+        self._final: Optional[Dict[Tuple[str, str], Dict[str, float]]] = None
+        # Bumped by partial_fit() and finalize() so memoized scores from older state are not reused
+        self._version = 0
+    
+    def __setstate__(self, state):
+        if "_store" not in state:
+            # Models pickled before the array store kept nested
+            # level -> key -> macro -> list dicts; convert them on load
+            store = {}
+            for level, keys in state.pop("multipliers", {}).items():
+                for key, by_macro in keys.items():
+                    buf = _RatioBuffer()
+                    for macro, ratios in by_macro.items():
+                        idx = MACRO_INDEX.get(macro)
+                        if idx is None or not ratios:
+                            continue
+                        buf.extend(idx, np.asarray(ratios, dtype=np.float64))
+                    if any(buf.counts):
+                        store[(level, key)] = buf
+            state.pop("sample_counts", None)
+            state["_store"] = store
+        state.setdefault("_final", None)
+        state.setdefault("_version", 0)
+        self.__dict__.update(state)
     
     def train(
         self,
@@ -111,58 +221,102 @@ class CalibrationModel:
             restaurant_truths: List of actual restaurant nutrition data
             restaurant_metadata: List of metadata dicts with 'restaurant' key
         """
+        self.partial_fit(baseline_estimates, restaurant_truths, restaurant_metadata)
+        self.finalize()
+    
+    def partial_fit(
+        self,
+        baseline_estimates: List[BaselineEstimate],
+        restaurant_truths: List[RestaurantTruth],
+        restaurant_metadata: List[Dict],
+    ):
+        """
+        Add one batch of training samples without recomputing multipliers.
+        
+        Ratios accumulate across calls, so training chunk by chunk and then
+        calling finalize() gives the same model as one train() over all rows.
+        """
         if len(baseline_estimates) != len(restaurant_truths):
             raise ValueError("baseline_estimates and restaurant_truths must have same length")
         
-        macros = ["calories", "fat", "carbs", "protein", "sodium"]
+        rows = list(zip(baseline_estimates, restaurant_truths, restaurant_metadata))
+        if not rows:
+            return
+        
+        # Ratios for all samples at once; NaN marks a missing or non-positive value
+        baseline_arr = _macro_matrix([baseline["macros"] for baseline, _, _ in rows])
+        truth_arr = _macro_matrix([truth for _, truth, _ in rows])
+        valid = (baseline_arr > 0) & (truth_arr > 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratios_arr = np.where(valid, truth_arr / baseline_arr, np.nan)
         
-        for baseline, truth, metadata in zip(baseline_estimates, restaurant_truths, restaurant_metadata):
+        # Extract features once per row
+        features_list = [extract_features(baseline, metadata) for baseline, _, metadata in rows]
+        
+        # Collect per bucket into array('d') first: appends stay in C doubles
+        # and each bucket is copied into its _RatioBuffer in one block
+        staging: Dict[Tuple[str, str], Tuple[array, ...]] = {}
+        for (_, truth, metadata), features, row_ratios, row_valid in zip(
+            rows, features_list, ratios_arr.tolist(), valid.tolist()
+        ):
             restaurant = metadata.get("restaurant", truth.get("chain", "unknown"))
             
-            # Extract features
-            from .feature_extraction import extract_features
-            features = extract_features(baseline, metadata)
+            # Buckets this sample contributes to, resolved once for all macros
+            buckets = [
+                ("restaurant", restaurant),
+                ("cuisine", features.cuisine),
+            ]
+            buckets.extend(("cooking_method", method) for method in features.cooking_methods)
+            buckets.extend([
+                ("sauce_level", features.sauce_level),
+                ("portion_class", features.portion_class),
+                ("oil_intensity", features.oil_intensity),
+                ("processing_level", features.processing_level),
+            ])
             
-            # Calculate ratios for each macro
-            for macro in macros:
-                baseline_val = baseline["macros"].get(macro, 0.0)
-                truth_val = truth.get(macro, 0.0)
-                
+            for macro_idx, (ratio, ok) in enumerate(zip(row_ratios, row_valid)):
                 # Skip if either value is missing or zero
-                if baseline_val <= 0 or truth_val <= 0:
+                if not ok:
                     continue
                 
-                ratio = truth_val / baseline_val
-                
                 # Store at different levels
-                # Restaurant level
-                self.multipliers["restaurant"][restaurant][macro].append(ratio)
-                self.sample_counts["restaurant"][restaurant][macro] += 1
-                
-                # Cuisine level
-                self.multipliers["cuisine"][features["cuisine"]][macro].append(ratio)
-                self.sample_counts["cuisine"][features["cuisine"]][macro] += 1
-                
-                # Cooking method level
-                for method in features["cooking_methods"]:
-                    self.multipliers["cooking_method"][method][macro].append(ratio)
-                    self.sample_counts["cooking_method"][method][macro] += 1
-                
-                # Sauce level
-                self.multipliers["sauce_level"][features["sauce_level"]][macro].append(ratio)
-                self.sample_counts["sauce_level"][features["sauce_level"]][macro] += 1
-                
-                # Portion class
-                self.multipliers["portion_class"][features["portion_class"]][macro].append(ratio)
-                self.sample_counts["portion_class"][features["portion_class"]][macro] += 1
-                
-                # Oil intensity
-                self.multipliers["oil_intensity"][features["oil_intensity"]][macro].append(ratio)
-                self.sample_counts["oil_intensity"][features["oil_intensity"]][macro] += 1
-                
-                # Processing level
-                self.multipliers["processing_level"][features["processing_level"]][macro].append(ratio)
-                self.sample_counts["processing_level"][features["processing_level"]][macro] += 1
+                for bucket in buckets:
+                    columns = staging.get(bucket)
+                    if columns is None:
+                        columns = staging[bucket] = tuple(array("d") for _ in MACROS)
+                    columns[macro_idx].append(ratio)
+        
+        store = self._store
+        for bucket, columns in staging.items():
+            buf = store.get(bucket)
+            if buf is None:
+                buf = store[bucket] = _RatioBuffer(max(len(c) for c in columns))
+            for macro_idx, column in enumerate(columns):
+                if column:
+                    buf.extend(macro_idx, column)
+        
+        # The precomputed table no longer matches the store; get_multipliers
+        # reads the store until the next finalize()
+        self._final = None
+        self._version += 1
+    
+    def finalize(self):
+        """
+        Precompute the robust multiplier for every (level, key, macro) with data.
+        
+        Multipliers only change when samples are added, so get_multipliers
+        reads this table instead of re-sorting ratios on every call. Each
+        partial_fit() drops the table; call finalize() again once done adding.
+        """
+        final = {}
+        for bucket, buf in self._store.items():
+            final[bucket] = {
+                macro: self._compute_robust_multiplier(buf.ratios(macro_idx))
+                for macro_idx, macro in enumerate(MACROS)
+                if buf.counts[macro_idx]
+            }
+        self._final = final
+        self._version += 1
     
     def get_multipliers(self, features: FeatureVector) -> Dict[str, Dict[str, float]]:
         """
@@ -171,47 +325,34 @@ class CalibrationModel:
         Returns:
             Dict mapping macro -> adjustment_type -> multiplier
         """
-        macros = ["calories", "fat", "carbs", "protein", "sodium"]
-        result = {macro: {} for macro in macros}
+        result = {macro: {} for macro in MACROS}
+        # One lookup per level: the finalized table (or the store) is keyed by (level, key)
+        final = self._final
+        store = self._store
         
         # Try each level in fallback order
-        for level in FALLBACK_ORDER:
-            if level == "default":
-                for macro in macros:
-                    result[macro][level] = DEFAULT_MULTIPLIERS[macro]
-                break
-            
-            # Get key for this level - level and level_key are the same for most
-            level_key = level  # Most levels use the same key
+        for level, keyfn in _KEY_EXTRACTORS:
+            key = keyfn(features)
             
-            if level == "restaurant":
-                key = features["restaurant"]
-            elif level == "cuisine":
-                key = features["cuisine"]
-            elif level == "cooking_method":
-                # Use first cooking method
-                key = features["cooking_methods"][0] if features["cooking_methods"] else None
-            elif level == "sauce_level":
-                key = features["sauce_level"]
-            elif level == "portion_class":
-                key = features["portion_class"]
-            elif level == "oil_intensity":
-                key = features["oil_intensity"]
-            elif level == "processing_level":
-                key = features["processing_level"]
-            else:
+            if key is None:
                 continue
             
-            if key is None:
+            if final is not None:
+                level_multipliers = final.get((level, key))
+                if level_multipliers:
+                    for macro, multiplier in level_multipliers.items():
+                        result[macro][level] = multiplier
+                    # Found data at this level, don't fall back further
+                    break
                 continue
             
-            # Check if we have data for this level
+            # Not finalized: compute from the raw ratios
             has_data = False
-            for macro in macros:
-                # Use level_key to access the correct multiplier dictionary
-                if level_key in self.multipliers:
-                    ratios = self.multipliers[level_key].get(key, {}).get(macro, [])
-                    if ratios:
+            buf = store.get((level, key))
+            if buf is not None:
+                for macro_idx, macro in enumerate(MACROS):
+                    ratios = buf.ratios(macro_idx)
+                    if ratios.size:
                         has_data = True
                         multiplier = self._compute_robust_multiplier(ratios)
                         result[macro][level] = multiplier
@@ -219,6 +360,10 @@ class CalibrationModel:
             # If we found data at this level, use it (don't fall back further)
             if has_data:
                 break
+        else:
+            # No level had data: fall through to the defaults
+            for macro in MACROS:
+                result[macro]["default"] = DEFAULT_MULTIPLIERS[macro]
         
         return result
     
@@ -227,60 +372,115 @@ class CalibrationModel:
         Compute robust multiplier from list of ratios.
         Uses trimmed mean if enough samples, median otherwise.
         """
-        if not ratios:
+        if len(ratios) == 0:
             return 1.0
         
-        # Convert to list if needed (handles numpy arrays and lists)
-        ratios_list = list(ratios) if not isinstance(ratios, list) else ratios
-        
-        # Remove outliers (beyond 3 standard deviations)
-        mean = np.mean(ratios_list)
-        std = np.std(ratios_list)
-        
-        if std > 0:
-            # Filter outliers
-            filtered_ratios = [
-                r for r in ratios_list
-                if abs(r - mean) <= 3 * std
-            ]
-            if filtered_ratios:  # Only use filtered if we have any left
-                ratios_list = filtered_ratios
-        
-        if len(ratios_list) < MEDIAN_FALLBACK_THRESHOLD:
-            # Use median for small samples
-            return float(np.median(ratios_list))
-        
-        # Use trimmed mean for larger samples
-        trim_count = int(len(ratios_list) * TRIMMED_MEAN_PERCENT)
-        if trim_count > 0 and len(ratios_list) > trim_count * 2:
-            sorted_ratios = sorted(ratios_list)
-            trimmed = sorted_ratios[trim_count:-trim_count]
-            return float(np.mean(trimmed))
+        # Single float64 conversion; the kernel works on the array from here on
+        return _robust_multiplier_kernel(np.asarray(ratios, dtype=np.float64))
+    
+    def get_ratios(self, level: str, key: str, macro: str) -> "np.ndarray":
+        """Ratios observed for (level, key, macro); an empty array if none."""
+        buf = self._store.get((level, key))
+        if buf is None:
+            return np.empty(0, dtype=np.float64)
+        return buf.ratios(MACRO_INDEX[macro])
+    
+    def get_count(self, level: str, key: str, macro: str) -> int:
+        """Number of ratios observed for (level, key, macro)."""
+        buf = self._store.get((level, key))
+        return buf.counts[MACRO_INDEX[macro]] if buf is not None else 0
+    
+    def level_keys(self, level: str) -> List[str]:
+        """Keys with any observed ratios at the given level."""
+        return [key for lvl, key in self._store if lvl == level]
+    
+    def sample_count_matrix(self, level: str) -> Tuple[List[str], "np.ndarray"]:
+        """
+        Sample counts for every key at a level as one array.
         
-        return float(np.mean(ratios_list))
+        Returns:
+            (keys, counts) where keys follows level_keys() order and counts is
+            an int32 array of shape (len(keys), len(MACROS)).
+        """
+        keys = []
+        rows = []
+        for (lvl, key), buf in self._store.items():
+            if lvl == level:
+                keys.append(key)
+                rows.append(buf.counts)
+        counts = np.array(rows, dtype=np.int32).reshape(len(keys), len(MACROS))
+        return keys, counts
     
     def get_sample_count(self, features: FeatureVector, macro: str) -> int:
         """Get number of samples backing the multiplier for given features."""
+        # Resolve the macro row and the store once for all fallback levels
+        macro_idx = MACRO_INDEX[macro]
+        store = self._store
+        
         # Try restaurant level first
-        restaurant = features["restaurant"]
-        if restaurant in self.sample_counts["restaurant"]:
-            count = self.sample_counts["restaurant"][restaurant].get(macro, 0)
-            if count > 0:
-                return count
+        buf = store.get(("restaurant", features.restaurant))
+        if buf is not None and buf.counts[macro_idx] > 0:
+            return buf.counts[macro_idx]
         
         # Fall back to cuisine
-        cuisine = features["cuisine"]
-        if cuisine in self.sample_counts["cuisine"]:
-            count = self.sample_counts["cuisine"][cuisine].get(macro, 0)
-            if count > 0:
-                return count
+        buf = store.get(("cuisine", features.cuisine))
+        if buf is not None and buf.counts[macro_idx] > 0:
+            return buf.counts[macro_idx]
         
         # Fall back to cooking method
-        if features["cooking_methods"]:
-            method = features["cooking_methods"][0]
-            if method in self.sample_counts["cooking_method"]:
-                count = self.sample_counts["cooking_method"][method].get(macro, 0)
-                if count > 0:
-                    return count
+        if features.cooking_methods:
+            buf = store.get(("cooking_method", features.cooking_methods[0]))
+            if buf is not None and buf.counts[macro_idx] > 0:
+                return buf.counts[macro_idx]
         
         return 0
+
+
+def save_model(model: CalibrationModel, path: str) -> None:
+    """
+    Write a trained model to disk.
+    
+    Uses joblib (uncompressed) when available so the ratio buffers are stored
+    as raw arrays that load_model can memory-map; plain pickle otherwise, with
+    protocol 5 so arrays are written from their own buffers rather than
+    through an intermediate bytes copy.
+    
+    The model is written to a temporary file next to path and renamed over
+    it, so a process that has the old file memory-mapped keeps reading the
+    old contents instead of a truncated file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        try:
+            import joblib
+        except ImportError:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+        else:
+            os.close(fd)
+            joblib.dump(model, tmp_path, compress=0)
+        # mkstemp creates the file 0600; keep the permissions of the file being replaced
+        os.chmod(tmp_path, os.stat(path).st_mode & 0o777 if os.path.exists(path) else 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def load_model(path: str, mmap_mode: Optional[str] = "r") -> CalibrationModel:
+    """
+    Load a model written by save_model (or a plain pickle).
+    
+    With joblib, ratio buffers are memory-mapped (read-only by default), so
+    cold start skips copying them and worker processes share the pages.
+    A mapped file must then be replaced (save_model, mv), never rewritten in
+    place (cp over it): truncating it under a running process crashes it.
+    """
+    try:
+        import joblib
+    except ImportError:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    return joblib.load(path, mmap_mode=mmap_mode)
@@ -2,35 +2,27 @@
 Confidence scoring for calibration adjustments.
 """
 
-try:
-    import numpy as np
-except ImportError:
-    # Fallback if numpy not available
-    class np:
-        @staticmethod
-        def var(x):
-            if len(x) == 0:
-                return 0
-            mean = sum(x) / len(x)
-            return sum((xi - mean) ** 2 for xi in x) / len(x)
-        @staticmethod
-        def std(x):
-            return np.var(x) ** 0.5
-        @staticmethod
-        def mean(x):
-            return sum(x) / len(x) if len(x) > 0 else 0
-        @staticmethod
-        def clip(x, min_val, max_val):
-            return max(min_val, min(max_val, x))
+from functools import lru_cache
+from typing import Dict, Tuple
 
-from typing import Dict
 from .schemas import FeatureVector
 from .config import (
     MIN_SAMPLES_FOR_CONFIDENCE,
     HIGH_CONFIDENCE_THRESHOLD,
     MEDIUM_CONFIDENCE_THRESHOLD,
 )
-from .calibration_model import CalibrationModel
+from .calibration_model import CalibrationModel, _mean_std
+
+
+# Memoized scores keyed by (model, model version, features, macro). The model
+# object itself is part of the key so its id cannot be reused while cached.
+_CACHE_MAXSIZE = 4096
+_cache: Dict[Tuple, float] = {}
+
+
+def clear_confidence_cache():
+    """Drop memoized scores (called when the global model changes)."""
+    _cache.clear()
 
 
 def confidence_score(
@@ -54,6 +46,22 @@ def confidence_score(
     Returns:
         Confidence score between 0.0 and 1.0
     """
+    # The score is a pure function of the model state, features and macro
+    key = (model, getattr(model, "_version", 0), features, macro)
+    score = _cache.get(key)
+    if score is None:
+        if len(_cache) >= _CACHE_MAXSIZE:
+            _cache.clear()
+        score = _cache[key] = _confidence_score(model, features, macro)
+    return score
+
+
+def _confidence_score(
+    model: CalibrationModel,
+    features: FeatureVector,
+    macro: str
+) -> float:
+    """Uncached confidence_score."""
     # Get sample count
     sample_count = model.get_sample_count(features, macro)
     
@@ -81,7 +89,8 @@ def confidence_score(
         0.2 * ontology_confidence
     )
     
-    return float(np.clip(confidence, 0.0, 1.0))
+    # Scalar clamp to [0, 1]; np.clip dispatch costs far more than the math here
+    return 0.0 if confidence < 0.0 else 1.0 if confidence > 1.0 else float(confidence)
 
 
 def _compute_variance_confidence(
@@ -91,25 +100,18 @@ def _compute_variance_confidence(
 ) -> float:
     """Compute confidence based on variance in observed ratios."""
     # Try to get ratios for this feature combination
-    restaurant = features["restaurant"]
-    ratios = []
-    
-    if restaurant in model.multipliers["restaurant"]:
-        ratios = model.multipliers["restaurant"][restaurant].get(macro, [])
+    ratios = model.get_ratios("restaurant", features.restaurant, macro)
     
-    if not ratios:
+    if not ratios.size:
         # Fall back to cuisine
-        cuisine = features["cuisine"]
-        if cuisine in model.multipliers["cuisine"]:
-            ratios = model.multipliers["cuisine"][cuisine].get(macro, [])
+        ratios = model.get_ratios("cuisine", features.cuisine, macro)
     
     if len(ratios) < 2:
         return 0.5  # Neutral if not enough data
     
     # Lower variance = higher confidence
-    variance = np.var(ratios)
-    std = np.std(ratios)
-    mean = np.mean(ratios)
+    # get_ratios already returns a float64 array
+    mean, std = _mean_std(ratios)
     
     if mean == 0:
         return 0.5
@@ -132,31 +134,35 @@ def _compute_variance_confidence(
         return 0.3
 
 
+@lru_cache(maxsize=4096)
 def _compute_ontology_confidence(features: FeatureVector) -> float:
     """
     Compute confidence based on ontology match strength.
     Higher confidence if features are well-defined and match ontology.
+    
+    Depends only on the (hashable) features, not the macro or model, so it is
+    memoized across the five per-macro scores of a calibrate call.
     """
     confidence = 1.0
     
     # Penalize unknown restaurant
-    if features["restaurant"] == "unknown":
+    if features.restaurant == "unknown":
         confidence *= 0.7
     
     # Penalize default cuisine
-    if features["cuisine"] == "american" and "unknown" not in features["restaurant"].lower():
+    if features.cuisine == "american" and "unknown" not in features.restaurant.lower():
         # American is default, might be less specific
         confidence *= 0.9
     
     # Penalize if cooking methods are default
-    if features["cooking_methods"] == ["fried"]:
+    if features.cooking_methods == ("fried",):
         confidence *= 0.9
     
     # Boost if we have specific features
-    if features["sauce_level"] != "none":
+    if features.sauce_level != "none":
         confidence *= 1.05  # Slight boost for specificity
     
-    if features["processing_level"] != "processed":
+    if features.processing_level != "processed":
         confidence *= 1.05  # Slight boost for specificity
     
     return min(1.0, confidence)
@@ -2,6 +2,12 @@
 Configuration for Layer 2 calibration engine.
 """
 
+from typing import Dict, Tuple
+
+# Macros calibrated by Layer 2, in storage/array column order
+MACROS: Tuple[str, ...] = ("calories", "fat", "carbs", "protein", "sodium")
+MACRO_INDEX: Dict[str, int] = {macro: i for i, macro in enumerate(MACROS)}
+
 # Default multipliers when no data is available
 DEFAULT_MULTIPLIERS = {
     "calories": 1.0,
@@ -3,17 +3,36 @@ Deterministic feature extraction from baseline estimates and restaurant metadata
 NO LLM CALLS ALLOWED - rule-based only.
 """
 
-from typing import Dict, List
-from .schemas import BaselineEstimate, FeatureVector
+import re
+import sys
+from typing import Dict, List, Tuple
+import numpy as np
+
+from .schemas import BaselineEstimate, FeatureVector, FeatureVectorArray
 from .ontology import (
     normalize_cooking_method,
     normalize_cuisine,
     infer_oil_intensity,
     infer_processing_level,
     SAUCE_LEVELS,
+    OIL_INTENSITY_CODES,
+    PROCESSING_LEVEL_CODES,
+    PORTION_CLASS_CODES,
+    PRICE_BUCKET_CODES,
 )
 
 
+# Heavy-sauce keywords, fused into one pattern scanned once per sauce
+_HEAVY_RE = re.compile(r"gravy|cream|cheese sauce|mayo|ranch|heavy")
+
+# Restaurant-name keywords for price inference, one alternation per bucket
+_PREMIUM_KEYWORDS = ["five guys", "shake shack", "pf changs", "olive garden", 
+                     "red lobster", "outback", "texas roadhouse"]
+_MID_KEYWORDS = ["chipotle", "panera", "cava", "panda express", "subway"]
+_PREMIUM_RE = re.compile("|".join(map(re.escape, _PREMIUM_KEYWORDS)))
+_MID_RE = re.compile("|".join(map(re.escape, _MID_KEYWORDS)))
+
+
 def extract_features(
     baseline_estimate: BaselineEstimate,
     restaurant_metadata: Dict
@@ -28,11 +47,12 @@ def extract_features(
     Returns:
         FeatureVector with all required fields
     """
-    restaurant = restaurant_metadata.get("restaurant", "unknown").strip()
+    # Category strings are interned: they key the model's bucket dicts on every lookup
+    restaurant = sys.intern(restaurant_metadata.get("restaurant", "unknown").strip())
     
     # Normalize cooking methods
     cooking_methods = [
-        normalize_cooking_method(method)
+        sys.intern(normalize_cooking_method(method))
         for method in baseline_estimate.get("cooking_methods", [])
     ]
     
@@ -41,7 +61,7 @@ def extract_features(
         cooking_methods = ["fried"]  # Most common default
     
     # Determine cuisine
-    cuisine = normalize_cuisine(restaurant)
+    cuisine = sys.intern(normalize_cuisine(restaurant))
     
     # Determine oil intensity
     oil_intensity = infer_oil_intensity(cooking_methods, cuisine)
@@ -57,6 +77,7 @@ def extract_features(
     portion_class = baseline_estimate.get("portion_class", "entree")
     if portion_class not in ["snack", "entree", "platter"]:
         portion_class = "entree"  # Default
+    portion_class = sys.intern(portion_class)
     
     # Price bucket (if available)
     price = restaurant_metadata.get("price")
@@ -65,7 +86,7 @@ def extract_features(
     return FeatureVector(
         restaurant=restaurant,
         cuisine=cuisine,
-        cooking_methods=cooking_methods,
+        cooking_methods=tuple(cooking_methods),
         oil_intensity=oil_intensity,
         sauce_level=sauce_level,
         processing_level=processing_level,
@@ -74,6 +95,76 @@ def extract_features(
     )
 
 
+def extract_features_batch(
+    baseline_estimates: List[BaselineEstimate],
+    restaurant_metadata: List[Dict]
+) -> FeatureVectorArray:
+    """
+    Extract features for many items into column-wise integer codes.
+    
+    One extract_features pass per row; string fields are interned to ids so
+    batch code can group and gather on the (N, 8) code matrix.
+    """
+    restaurant_ids: Dict[str, int] = {}
+    cuisine_ids: Dict[str, int] = {}
+    method_ids: Dict[Tuple[str, ...], int] = {}
+    columns = [[] for _ in range(8)]
+    
+    for baseline, metadata in zip(baseline_estimates, restaurant_metadata):
+        f = extract_features(baseline, metadata)
+        columns[0].append(restaurant_ids.setdefault(f.restaurant, len(restaurant_ids)))
+        columns[1].append(cuisine_ids.setdefault(f.cuisine, len(cuisine_ids)))
+        columns[2].append(method_ids.setdefault(f.cooking_methods, len(method_ids)))
+        columns[3].append(OIL_INTENSITY_CODES[f.oil_intensity])
+        columns[4].append(SAUCE_LEVELS[f.sauce_level])
+        columns[5].append(PROCESSING_LEVEL_CODES[f.processing_level])
+        columns[6].append(PORTION_CLASS_CODES[f.portion_class])
+        columns[7].append(PRICE_BUCKET_CODES[f.price_bucket])
+    
+    return FeatureVectorArray(
+        restaurant_ids=np.array(columns[0], dtype=np.int32),
+        cuisine_ids=np.array(columns[1], dtype=np.int32),
+        cooking_method_ids=np.array(columns[2], dtype=np.int32),
+        oil_intensity=np.array(columns[3], dtype=np.int8),
+        sauce_level=np.array(columns[4], dtype=np.int8),
+        processing_level=np.array(columns[5], dtype=np.int8),
+        portion_class=np.array(columns[6], dtype=np.int8),
+        price_bucket=np.array(columns[7], dtype=np.int8),
+        restaurants=list(restaurant_ids),
+        cuisines=list(cuisine_ids),
+        cooking_method_sets=list(method_ids),
+    )
+
+
+def feature_vector_at(features: FeatureVectorArray, i: int) -> FeatureVector:
+    """Decode row i of a FeatureVectorArray back into a FeatureVector."""
+    return FeatureVector(
+        restaurant=features.restaurants[features.restaurant_ids[i]],
+        cuisine=features.cuisines[features.cuisine_ids[i]],
+        cooking_methods=features.cooking_method_sets[features.cooking_method_ids[i]],
+        oil_intensity=_OIL_NAMES[features.oil_intensity[i]],
+        sauce_level=_SAUCE_NAMES[features.sauce_level[i]],
+        processing_level=_PROCESSING_NAMES[features.processing_level[i]],
+        portion_class=_PORTION_NAMES[features.portion_class[i]],
+        price_bucket=_PRICE_NAMES[features.price_bucket[i]],
+    )
+
+
+def _code_names(codes: Dict[str, int]) -> Tuple[str, ...]:
+    """Invert a name -> code table into a code-indexed tuple of names."""
+    names = [None] * len(codes)
+    for name, code in codes.items():
+        names[code] = name
+    return tuple(names)
+
+
+_OIL_NAMES = _code_names(OIL_INTENSITY_CODES)
+_SAUCE_NAMES = _code_names(SAUCE_LEVELS)
+_PROCESSING_NAMES = _code_names(PROCESSING_LEVEL_CODES)
+_PORTION_NAMES = _code_names(PORTION_CLASS_CODES)
+_PRICE_NAMES = _code_names(PRICE_BUCKET_CODES)
+
+
 def _determine_sauce_level(sauces: List[str]) -> str:
     """Determine sauce level from sauce list."""
     if not sauces:
@@ -83,9 +174,7 @@ def _determine_sauce_level(sauces: List[str]) -> str:
     sauce_count = len(sauces)
     
     # Check for heavy sauce keywords
-    heavy_keywords = ["gravy", "cream", "cheese sauce", "mayo", "ranch", "heavy"]
-    has_heavy = any(keyword in sauce.lower() for sauce in sauces 
-                    for keyword in heavy_keywords)
+    has_heavy = any(_HEAVY_RE.search(sauce.lower()) for sauce in sauces)
     
     if has_heavy or sauce_count >= 3:
         return "heavy"
@@ -111,14 +200,11 @@ def _determine_price_bucket(price: float = None, restaurant: str = "") -> str:
     restaurant_lower = restaurant.lower()
     
     # Premium restaurants
-    premium_keywords = ["five guys", "shake shack", "pf changs", "olive garden", 
-                       "red lobster", "outback", "texas roadhouse"]
-    if any(kw in restaurant_lower for kw in premium_keywords):
+    if _PREMIUM_RE.search(restaurant_lower):
         return "premium"
     
     # Mid-range
-    mid_keywords = ["chipotle", "panera", "cava", "panda express", "subway"]
-    if any(kw in restaurant_lower for kw in mid_keywords):
+    if _MID_RE.search(restaurant_lower):
         return "mid"
     
     # Cheap (fast food)
@@ -2,12 +2,15 @@
 Public inference API - the ONLY entry point for Layer 2.
 """
 
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
 from .schemas import BaselineEstimate, CalibrationResult, FeatureVector
-from .feature_extraction import extract_features
+from .feature_extraction import extract_features, extract_features_batch, feature_vector_at
 from .calibration_model import CalibrationModel
-from .confidence import confidence_score
-from .config import DEFAULT_MULTIPLIERS
+from .confidence import confidence_score, clear_confidence_cache
+from .config import DEFAULT_MULTIPLIERS, FALLBACK_ORDER, MACROS
 
 
 # Global model instance (should be trained before use)
@@ -17,7 +20,12 @@ _model: Optional[CalibrationModel] = None
 def set_model(model: CalibrationModel):
     """Set the global calibration model."""
     global _model
+    if model is not None and getattr(model, "_final", None) is None:
+        # Older pickles (or models never trained) have no precomputed table
+        model.finalize()
     _model = model
+    # Cached scores hold references to the previous model; release them
+    clear_confidence_cache()
 
 
 def get_model() -> Optional[CalibrationModel]:
@@ -52,45 +60,27 @@ def calibrate(
     # Extract features
     features = extract_features(baseline_estimate, restaurant_metadata)
     
-    # Get multipliers
-    multipliers_dict = model.get_multipliers(features)
+    # Get multipliers (and confidences) per macro
+    multipliers, adjustment_types, confidences = _resolve_adjustments(model, features)
     
     # Apply multipliers to each macro
     adjusted_macros = {}
     confidence_scores = {}
     applied_adjustments = {}
     
-    macros = ["calories", "fat", "carbs", "protein", "sodium"]
-    
-    for macro in macros:
+    for i, macro in enumerate(MACROS):
         baseline_val = baseline_estimate["macros"].get(macro, 0.0)
-        
-        # Get the best multiplier (prefer restaurant, then cuisine, then default)
-        multiplier = DEFAULT_MULTIPLIERS[macro]
-        adjustment_type = "default"
-        
-        if macro in multipliers_dict:
-            macro_multipliers = multipliers_dict[macro]
-            # Prefer restaurant > cuisine > cooking_method > default
-            for level in ["restaurant", "cuisine", "cooking_method", "sauce_level", 
-                         "portion_class", "oil_intensity", "processing_level", "default"]:
-                if level in macro_multipliers:
-                    multiplier = macro_multipliers[level]
-                    adjustment_type = level
-                    break
+        multiplier = multipliers[i]
         
         # Apply multiplier
         adjusted_val = baseline_val * multiplier
         adjusted_macros[macro] = adjusted_val
-        
-        # Compute confidence
-        conf = confidence_score(model, features, macro)
-        confidence_scores[macro] = conf
+        confidence_scores[macro] = confidences[i]
         
         # Store applied adjustment
         applied_adjustments[macro] = {
             "multiplier": multiplier,
-            "adjustment_type": adjustment_type,
+            "adjustment_type": adjustment_types[i],
             "baseline": baseline_val,
             "adjusted": adjusted_val,
         }
@@ -102,18 +92,117 @@ def calibrate(
     )
 
 
+def calibrate_batch(
+    baseline_estimates: List[BaselineEstimate],
+    restaurant_metadata: List[Dict],
+    model: Optional[CalibrationModel] = None
+) -> List[CalibrationResult]:
+    """
+    Calibrate many baselines at once; same results as calling calibrate() per item.
+    
+    Features are encoded column-wise (FeatureVectorArray); multipliers and
+    confidences are resolved once per distinct code row and gathered back,
+    and the baseline * multiplier products are computed as one (N, 5) array op.
+    
+    Args:
+        baseline_estimates: Inputs from Layer 1 (DO NOT MODIFY)
+        restaurant_metadata: One metadata dict per baseline
+        model: Optional CalibrationModel (uses global if not provided)
+    
+    Returns:
+        List of CalibrationResult, in input order
+    """
+    if len(baseline_estimates) != len(restaurant_metadata):
+        raise ValueError("baseline_estimates and restaurant_metadata must have same length")
+    
+    if model is None:
+        model = _model
+    
+    if model is None:
+        return [_fallback_calibration(baseline) for baseline in baseline_estimates]
+    
+    if not baseline_estimates:
+        return []
+    
+    # Group rows by their feature codes and resolve each distinct feature vector once
+    features = extract_features_batch(baseline_estimates, restaurant_metadata)
+    _, first_rows, row_index = np.unique(
+        features.codes(), axis=0, return_index=True, return_inverse=True
+    )
+    row_index = row_index.reshape(-1)
+    resolved = [_resolve_adjustments(model, feature_vector_at(features, i)) for i in first_rows]
+    
+    baselines_arr = np.array(
+        [[baseline["macros"].get(m, 0.0) for m in MACROS] for baseline in baseline_estimates],
+        dtype=np.float64,
+    )
+    mult_arr = np.array([r[0] for r in resolved], dtype=np.float64)[row_index]
+    adjusted_rows = (baselines_arr * mult_arr).tolist()
+    
+    results = []
+    for baseline, idx, adjusted in zip(baseline_estimates, row_index.tolist(), adjusted_rows):
+        multipliers, adjustment_types, confidences = resolved[idx]
+        base_macros = baseline["macros"]
+        applied_adjustments = {}
+        for i, macro in enumerate(MACROS):
+            applied_adjustments[macro] = {
+                "multiplier": multipliers[i],
+                "adjustment_type": adjustment_types[i],
+                "baseline": base_macros.get(macro, 0.0),
+                "adjusted": adjusted[i],
+            }
+        results.append(CalibrationResult(
+            adjusted_macros=dict(zip(MACROS, adjusted)),
+            confidence=dict(zip(MACROS, confidences)),
+            applied_adjustments=applied_adjustments,
+        ))
+    
+    return results
+
+
+def _resolve_adjustments(
+    model: CalibrationModel,
+    features: FeatureVector
+) -> Tuple[List[float], List[str], List[float]]:
+    """Per-macro multiplier, adjustment type and confidence for one feature vector."""
+    multipliers_dict = model.get_multipliers(features)
+    
+    multipliers = []
+    adjustment_types = []
+    confidences = []
+    
+    for macro in MACROS:
+        # Get the best multiplier (prefer restaurant, then cuisine, then default)
+        multiplier = DEFAULT_MULTIPLIERS[macro]
+        adjustment_type = "default"
+        
+        macro_multipliers = multipliers_dict.get(macro)
+        if macro_multipliers:
+            # Prefer levels in fallback order (restaurant > cuisine > ... > default)
+            for level in FALLBACK_ORDER:
+                if (m := macro_multipliers.get(level)) is not None:
+                    multiplier, adjustment_type = m, level
+                    break
+        
+        multipliers.append(multiplier)
+        adjustment_types.append(adjustment_type)
+        
+        # Compute confidence
+        confidences.append(confidence_score(model, features, macro))
+    
+    return multipliers, adjustment_types, confidences
+
+
 def _fallback_calibration(baseline_estimate: BaselineEstimate) -> CalibrationResult:
     """Fallback when no model is available."""
-    macros = ["calories", "fat", "carbs", "protein", "sodium"]
-    
     adjusted_macros = {
         macro: baseline_estimate["macros"].get(macro, 0.0)
-        for macro in macros
+        for macro in MACROS
     }
     
     confidence_scores = {
         macro: 0.1  # Very low confidence
-        for macro in macros
+        for macro in MACROS
     }
     
     applied_adjustments = {
@@ -123,7 +212,7 @@ def _fallback_calibration(baseline_estimate: BaselineEstimate) -> CalibrationRes
             "baseline": baseline_estimate["macros"].get(macro, 0.0),
             "adjusted": baseline_estimate["macros"].get(macro, 0.0),
         }
-        for macro in macros
+        for macro in MACROS
     }
     
     return CalibrationResult(
@@ -7,28 +7,71 @@ This script analyzes the calibration model to identify:
 - Macros with high variance
 """
 
+import heapq
 import sys
+from operator import itemgetter
 from pathlib import Path
-import pickle
-from collections import defaultdict
+
+import numpy as np
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from layer2 import CalibrationModel
+from layer2 import CalibrationModel, load_model
 from .confidence import confidence_score
 from .schemas import FeatureVector
+from .config import MACROS
+from .variance_filter import pack_groups, filter_high_variance
+
+
+def _score_restaurant(model: CalibrationModel, restaurant: str) -> dict:
+    """Confidence per macro for a typical fried fast-food entree at restaurant."""
+    features = FeatureVector(
+        restaurant=restaurant,
+        cuisine="american",  # Will be normalized
+        cooking_methods=("fried",),
+        oil_intensity="high",
+        sauce_level="medium",
+        processing_level="ultra_processed",
+        portion_class="entree",
+        price_bucket="cheap"
+    )
+    return {macro: confidence_score(model, features, macro) for macro in MACROS}
 
 
-def analyze_model_confidence(model_path: str = "layer2/trained_model.pkl"):
-    """Analyze confidence scores across the model."""
+def _score_restaurants(model: CalibrationModel, restaurants: list, n_jobs: int = 1) -> list:
+    """Score restaurants in order, fanned out over joblib threads when n_jobs != 1."""
+    if n_jobs != 1:
+        try:
+            from joblib import Parallel, delayed
+        except ImportError:
+            pass
+        else:
+            return Parallel(n_jobs=n_jobs, prefer="threads")(
+                delayed(_score_restaurant)(model, r) for r in restaurants
+            )
+    return [_score_restaurant(model, r) for r in restaurants]
+
+
+def analyze_model_confidence(
+    model_path: str = "layer2/trained_model.pkl",
+    top_n: int = 5,
+    n_jobs: int = 1
+):
+    """
+    Analyze confidence scores across the model.
+    
+    Args:
+        model_path: Path to the trained model
+        top_n: Number of best-sampled restaurants to score
+        n_jobs: joblib workers for the confidence sweep (-1 = all cores)
+    """
     print("=" * 60)
     print("Layer 2 Confidence Analysis")
     print("=" * 60)
     
     # Load model
     try:
-        with open(model_path, 'rb') as f:
-            model = pickle.load(f)
+        model = load_model(model_path)
         print(f"✅ Loaded model from {model_path}\n")
     except FileNotFoundError:
         print(f"❌ Model not found at {model_path}")
@@ -39,20 +82,19 @@ def analyze_model_confidence(model_path: str = "layer2/trained_model.pkl"):
     print("📊 Sample Count Analysis:")
     print("-" * 60)
     
-    restaurant_counts = defaultdict(int)
-    for restaurant, macros in model.sample_counts['restaurant'].items():
-        total = sum(macros.values())
-        restaurant_counts[restaurant] = total
-    
-    # Sort by count
-    sorted_restaurants = sorted(restaurant_counts.items(), key=lambda x: x[1], reverse=True)
+    # Total per restaurant from the (restaurants, macros) count matrix; stable
+    # sort keeps ties in model order
+    restaurants, counts = model.sample_count_matrix('restaurant')
+    totals = counts.sum(axis=1)
+    order = np.argsort(-totals, kind='stable')
+    sorted_restaurants = [(restaurants[i], int(totals[i])) for i in order]
     
     print(f"\n   Restaurants with most samples:")
     for restaurant, count in sorted_restaurants[:10]:
         print(f"     {restaurant:30s}: {count:4d} samples")
     
     print(f"\n   Restaurants with few samples (< 5):")
-    low_sample_restaurants = [(r, c) for r, c in sorted_restaurants if c < 5]
+    low_sample_restaurants = [rc for rc in sorted_restaurants if rc[1] < 5]
     if low_sample_restaurants:
         for restaurant, count in low_sample_restaurants:
             print(f"     {restaurant:30s}: {count:4d} samples ⚠️")
@@ -63,30 +105,11 @@ def analyze_model_confidence(model_path: str = "layer2/trained_model.pkl"):
     print(f"\n📈 Confidence Score Analysis:")
     print("-" * 60)
     
-    test_restaurants = [r for r, _ in sorted_restaurants[:5]]
+    test_restaurants = [r for r, _ in sorted_restaurants[:top_n]]
     
-    for restaurant in test_restaurants:
+    for restaurant, confidences in zip(test_restaurants, _score_restaurants(model, test_restaurants, n_jobs)):
         print(f"\n   Restaurant: {restaurant}")
         
-        # Create sample features
-        features = FeatureVector(
-            restaurant=restaurant,
-            cuisine="american",  # Will be normalized
-            cooking_methods=["fried"],
-            oil_intensity="high",
-            sauce_level="medium",
-            processing_level="ultra_processed",
-            portion_class="entree",
-            price_bucket="cheap"
-        )
-        
-        # Get confidence for each macro
-        macros = ["calories", "fat", "carbs", "protein", "sodium"]
-        confidences = {}
-        for macro in macros:
-            conf = confidence_score(model, features, macro)
-            confidences[macro] = conf
-        
         avg_confidence = sum(confidences.values()) / len(confidences)
         
         print(f"     Average confidence: {avg_confidence:.2f}")
@@ -99,18 +122,26 @@ def analyze_model_confidence(model_path: str = "layer2/trained_model.pkl"):
     print(f"\n📉 Multiplier Variance Analysis:")
     print("-" * 60)
     
-    high_variance_restaurants = []
-    for restaurant, macros in model.multipliers['restaurant'].items():
-        for macro, ratios in macros.items():
-            if len(ratios) >= 5:
-                import numpy as np
-                variance = np.var(ratios)
-                if variance > 0.1:  # High variance threshold
-                    high_variance_restaurants.append((restaurant, macro, variance, len(ratios)))
+    # Pack every (restaurant, macro) ratio group once, then screen them all
+    # in one batched pass
+    keys = []
+    groups = []
+    for restaurant in model.level_keys('restaurant'):
+        for macro in MACROS:
+            keys.append((restaurant, macro))
+            groups.append(model.get_ratios('restaurant', restaurant, macro))
+    
+    flat, offsets = pack_groups(groups)
+    # High variance threshold 0.1, groups of at least 5 samples
+    high_idx, high_var = filter_high_variance(flat, offsets, 0.1, min_count=5)
+    high_variance_restaurants = [
+        (*keys[i], float(variance), len(groups[i])) for i, variance in zip(high_idx, high_var)
+    ]
     
     if high_variance_restaurants:
         print(f"\n   Restaurants with high variance (> 0.1):")
-        for restaurant, macro, variance, count in sorted(high_variance_restaurants, key=lambda x: x[2], reverse=True)[:10]:
+        # nlargest == sorted(..., reverse=True)[:10], without sorting every case
+        for restaurant, macro, variance, count in heapq.nlargest(10, high_variance_restaurants, key=itemgetter(2)):
             print(f"     {restaurant:30s} {macro:10s}: variance={variance:.3f} (n={count})")
     else:
         print("     No high variance found")
@@ -118,9 +149,9 @@ def analyze_model_confidence(model_path: str = "layer2/trained_model.pkl"):
     # Summary
     print(f"\n📋 Summary:")
     print("-" * 60)
-    print(f"   Total restaurants: {len(model.multipliers['restaurant'])}")
-    print(f"   Total cuisines: {len(model.multipliers['cuisine'])}")
-    print(f"   Total cooking methods: {len(model.multipliers['cooking_method'])}")
+    print(f"   Total restaurants: {len(model.level_keys('restaurant'))}")
+    print(f"   Total cuisines: {len(model.level_keys('cuisine'))}")
+    print(f"   Total cooking methods: {len(model.level_keys('cooking_method'))}")
     print(f"   Restaurants with < 5 samples: {len(low_sample_restaurants)}")
     print(f"   High variance cases: {len(high_variance_restaurants)}")
     
@@ -145,7 +176,19 @@ if __name__ == "__main__":
         default="layer2/trained_model.pkl",
         help="Path to trained model"
     )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=5,
+        help="Number of best-sampled restaurants to score"
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Parallel workers for the confidence sweep (-1 = all cores)"
+    )
     
     args = parser.parse_args()
     
-    analyze_model_confidence(args.model)
+    analyze_model_confidence(args.model, top_n=args.top, n_jobs=args.jobs)
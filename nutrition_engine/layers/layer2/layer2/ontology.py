@@ -2,6 +2,9 @@
 Fixed ontology for mapping cooking methods, sauces, and processing levels.
 """
 
+import re
+from functools import lru_cache
+
 # Allowed cooking methods (from requirements)
 COOKING_METHODS = {
     "grilled",
@@ -88,6 +91,13 @@ OIL_INTENSITY_LEVELS = {
     "high",
 }
 
+# Integer codes for the fixed categorical features (SAUCE_LEVELS doubles as the
+# sauce code). Used by the column-wise FeatureVectorArray.
+OIL_INTENSITY_CODES = {"low": 0, "medium": 1, "high": 2}
+PROCESSING_LEVEL_CODES = {"fresh": 0, "processed": 1, "ultra_processed": 2}
+PORTION_CLASS_CODES = {"snack": 0, "entree": 1, "platter": 2}
+PRICE_BUCKET_CODES = {"cheap": 0, "mid": 1, "premium": 2}
+
 # Cuisine mapping (common restaurant cuisines)
 CUISINE_MAPPING = {
     # American
@@ -133,7 +143,6 @@ CUISINE_MAPPING = {
     
     # Mediterranean
     "cava": "mediterranean",
-    "panera bread": "mediterranean",  # Panera has Mediterranean influences
     
     # Seafood
     "red lobster": "seafood",
@@ -151,7 +160,9 @@ CUISINE_MAPPING = {
     
     # Sandwich/Deli
     "subway": "sandwich",
-    "panera bread": "sandwich",  # Also sandwiches
+    # Panera has Mediterranean influences but is mostly sandwiches; this was
+    # previously listed under both and the later "sandwich" entry won
+    "panera bread": "sandwich",
     
     # African/Portuguese
     "nandos": "african",
@@ -163,9 +174,47 @@ CUISINE_MAPPING = {
 }
 
 
+# The string normalizers below are pure functions of their arguments and see the
+# same few hundred restaurant/method names over and over, so they are memoized.
+
+# Partial-match tables, longest key first so the most specific key wins.
+# Built once at import instead of walking the mapping views on every call.
+_COOKING_METHOD_ITEMS = tuple(sorted(COOKING_METHOD_MAPPING.items(), key=lambda kv: -len(kv[0])))
+# Shorter input is not matched as part of a key: "" or "ok" would otherwise hit the longest key
+_MIN_PARTIAL_METHOD_LEN = 3
+_CUISINE_ITEMS = tuple(sorted(CUISINE_MAPPING.items(), key=lambda kv: -len(kv[0])))
+
+# Restaurant keywords per processing level, one alternation each
+_FAST_FOOD_KEYWORDS = ["mcdonalds", "burger king", "wendys", "taco bell", "kfc", 
+                       "pizza hut", "dominos", "subway", "dunkin"]
+_CASUAL_KEYWORDS = ["olive garden", "applebees", "red lobster", "outback", 
+                    "texas roadhouse", "dennys", "ihop"]
+_PREMIUM_KEYWORDS = ["five guys", "shake shack", "chipotle", "cava", "panera"]
+_PROCESSING_PATTERNS = tuple(
+    (re.compile("|".join(map(re.escape, keywords))), level)
+    for keywords, level in (
+        (_FAST_FOOD_KEYWORDS, "ultra_processed"),
+        (_CASUAL_KEYWORDS, "processed"),
+        (_PREMIUM_KEYWORDS, "fresh"),
+    )
+)
+
+
+# Source-format tags left on scraped restaurant names, e.g. "Wendy's (pdf)"
+_SUFFIX_RE = re.compile(r" \((?:pdf|html)\)")
+
+
+def _lower_strip(text: str) -> str:
+    """text.lower().strip(), skipping the copies when text is already clean."""
+    if text.islower() and text == text.strip():
+        return text
+    return text.lower().strip()
+
+
+@lru_cache(maxsize=4096)
 def normalize_cooking_method(method: str) -> str:
     """Normalize cooking method to canonical form."""
-    method_lower = method.lower().strip()
+    method_lower = _lower_strip(method)
     
     # Direct match
     if method_lower in COOKING_METHODS:
@@ -176,27 +225,29 @@ def normalize_cooking_method(method: str) -> str:
         return COOKING_METHOD_MAPPING[method_lower]
     
     # Partial match
-    for key, value in COOKING_METHOD_MAPPING.items():
-        if key in method_lower or method_lower in key:
+    reverse = len(method_lower) >= _MIN_PARTIAL_METHOD_LEN
+    for key, value in _COOKING_METHOD_ITEMS:
+        if key in method_lower or (reverse and method_lower in key):
             return value
     
     # Default to most common if unclear
     return "fried"  # Most common in fast food
 
 
+@lru_cache(maxsize=4096)
 def normalize_cuisine(restaurant: str) -> str:
     """Map restaurant name to cuisine type."""
-    restaurant_lower = restaurant.lower().strip()
+    restaurant_lower = _lower_strip(restaurant)
     
     # Remove common suffixes
-    restaurant_lower = restaurant_lower.replace(" (pdf)", "").replace(" (html)", "")
+    restaurant_lower = _SUFFIX_RE.sub("", restaurant_lower)
     
     # Direct match
     if restaurant_lower in CUISINE_MAPPING:
         return CUISINE_MAPPING[restaurant_lower]
     
     # Partial match
-    for key, value in CUISINE_MAPPING.items():
+    for key, value in _CUISINE_ITEMS:
         if key in restaurant_lower:
             return value
     
@@ -204,50 +255,42 @@ def normalize_cuisine(restaurant: str) -> str:
     return "american"
 
 
+_HIGH_OIL_METHODS = frozenset({"deep_fried", "fried"})
+_MEDIUM_OIL_METHODS = frozenset({"sauteed", "roasted", "baked"})
+_LOW_OIL_METHODS = frozenset({"steamed", "raw", "grilled"})
+
+
 def infer_oil_intensity(cooking_methods: list, cuisine: str) -> str:
     """Infer oil intensity from cooking methods and cuisine."""
     if not cooking_methods:
         return "medium"
     
-    methods_lower = [m.lower() for m in cooking_methods]
+    methods_lower = {m.lower() for m in cooking_methods}
     
     # High oil intensity
-    if any(m in ["deep_fried", "fried"] for m in methods_lower):
+    if not _HIGH_OIL_METHODS.isdisjoint(methods_lower):
         return "high"
     
     # Medium oil intensity
-    if any(m in ["sauteed", "roasted", "baked"] for m in methods_lower):
+    if not _MEDIUM_OIL_METHODS.isdisjoint(methods_lower):
         return "medium"
     
     # Low oil intensity
-    if any(m in ["steamed", "raw", "grilled"] for m in methods_lower):
+    if not _LOW_OIL_METHODS.isdisjoint(methods_lower):
         return "low"
     
     return "medium"
 
 
+@lru_cache(maxsize=4096)
 def infer_processing_level(restaurant: str, cuisine: str) -> str:
     """Infer processing level from restaurant and cuisine."""
     restaurant_lower = restaurant.lower()
     
-    # Fast food chains are typically ultra-processed
-    fast_food_keywords = ["mcdonalds", "burger king", "wendys", "taco bell", "kfc", 
-                         "pizza hut", "dominos", "subway", "dunkin"]
-    
-    if any(kw in restaurant_lower for kw in fast_food_keywords):
-        return "ultra_processed"
-    
-    # Casual dining is typically processed
-    casual_keywords = ["olive garden", "applebees", "red lobster", "outback", 
-                      "texas roadhouse", "dennys", "ihop"]
-    
-    if any(kw in restaurant_lower for kw in casual_keywords):
-        return "processed"
-    
-    # Premium/fast-casual is typically fresh
-    premium_keywords = ["five guys", "shake shack", "chipotle", "cava", "panera"]
-    
-    if any(kw in restaurant_lower for kw in premium_keywords):
-        return "fresh"
+    # Checked in priority order: fast food (ultra-processed), casual dining
+    # (processed), premium/fast-casual (fresh)
+    for pattern, level in _PROCESSING_PATTERNS:
+        if pattern.search(restaurant_lower):
+            return level
     
     return "processed"  # Default
@@ -2,7 +2,10 @@
 Type definitions and schemas for Layer 2.
 """
 
-from typing import TypedDict, List, Dict, Optional
+from dataclasses import dataclass
+from typing import TypedDict, NamedTuple, List, Dict, Optional, Tuple
+
+import numpy as np
 
 
 class BaselineEstimate(TypedDict):
@@ -26,11 +29,11 @@ class RestaurantTruth(TypedDict):
     sodium: float
 
 
-class FeatureVector(TypedDict):
-    """Extracted features for calibration"""
+class FeatureVector(NamedTuple):
+    """Extracted features for calibration (immutable and hashable)"""
     restaurant: str
     cuisine: str
-    cooking_methods: List[str]
+    cooking_methods: Tuple[str, ...]
     oil_intensity: str  # low | medium | high
     sauce_level: str  # none | light | medium | heavy
     processing_level: str  # fresh | processed | ultra_processed
@@ -38,6 +41,44 @@ class FeatureVector(TypedDict):
     price_bucket: str  # cheap | mid | premium
 
 
+@dataclass(slots=True)
+class FeatureVectorArray:
+    """
+    Many FeatureVectors stored column-wise as integer codes.
+    
+    Fixed categories use the int8 codes from ontology; restaurant, cuisine and
+    the cooking-method tuple are int32 ids into the per-batch tables below.
+    Row i decodes back to the exact FeatureVector it was built from.
+    """
+    restaurant_ids: np.ndarray  # int32 -> restaurants
+    cuisine_ids: np.ndarray  # int32 -> cuisines
+    cooking_method_ids: np.ndarray  # int32 -> cooking_method_sets
+    oil_intensity: np.ndarray  # int8, OIL_INTENSITY_CODES
+    sauce_level: np.ndarray  # int8, SAUCE_LEVELS
+    processing_level: np.ndarray  # int8, PROCESSING_LEVEL_CODES
+    portion_class: np.ndarray  # int8, PORTION_CLASS_CODES
+    price_bucket: np.ndarray  # int8, PRICE_BUCKET_CODES
+    restaurants: List[str]
+    cuisines: List[str]
+    cooking_method_sets: List[Tuple[str, ...]]
+    
+    def __len__(self) -> int:
+        return len(self.restaurant_ids)
+    
+    def codes(self) -> np.ndarray:
+        """(N, 8) int32 matrix of all columns; equal rows mean equal FeatureVectors."""
+        return np.column_stack([
+            self.restaurant_ids,
+            self.cuisine_ids,
+            self.cooking_method_ids,
+            self.oil_intensity,
+            self.sauce_level,
+            self.processing_level,
+            self.portion_class,
+            self.price_bucket,
+        ]).astype(np.int32, copy=False)
+
+
 class CalibrationResult(TypedDict):
     """Output from calibration"""
     adjusted_macros: Dict[str, float]
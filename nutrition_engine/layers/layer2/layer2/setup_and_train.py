@@ -12,6 +12,7 @@ This script:
 import sys
 import os
 import subprocess
+from importlib.util import find_spec
 from pathlib import Path
 
 def check_dependencies():
@@ -21,11 +22,11 @@ def check_dependencies():
     required = ['numpy', 'pandas']
     missing = []
     
+    # Locate packages without importing them; training imports them later
     for package in required:
-        try:
-            __import__(package)
+        if find_spec(package) is not None:
             print(f"   ✅ {package}")
-        except ImportError:
+        else:
             print(f"   ❌ {package} (missing)")
             missing.append(package)
     
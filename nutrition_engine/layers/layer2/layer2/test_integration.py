@@ -6,12 +6,11 @@ Tests the calibration engine with dummy Layer 1 outputs.
 
 import sys
 from pathlib import Path
-import pickle
 
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from layer2 import calibrate, CalibrationModel, set_model
+from layer2 import calibrate, calibrate_batch, CalibrationModel, set_model, load_model
 from .schemas import BaselineEstimate
 
 
@@ -58,8 +57,7 @@ def test_with_model():
     # Try to load trained model
     model_path = "layer2/trained_model.pkl"
     try:
-        with open(model_path, 'rb') as f:
-            model = pickle.load(f)
+        model = load_model(model_path)
         set_model(model)
         print(f"✅ Loaded trained model from {model_path}")
     except FileNotFoundError:
@@ -170,21 +168,64 @@ def test_feature_extraction():
     features = extract_features(baseline, {"restaurant": "McDonald's"})
     
     print(f"✅ Features extracted:")
-    print(f"   Restaurant: {features['restaurant']}")
-    print(f"   Cuisine: {features['cuisine']}")
-    print(f"   Cooking methods: {features['cooking_methods']}")
-    print(f"   Oil intensity: {features['oil_intensity']}")
-    print(f"   Sauce level: {features['sauce_level']}")
-    print(f"   Processing level: {features['processing_level']}")
-    print(f"   Portion class: {features['portion_class']}")
-    print(f"   Price bucket: {features['price_bucket']}")
-    
-    assert features['restaurant'] == "McDonald's"
-    assert features['cuisine'] in ['american', 'fast_food'] or 'american' in features['cuisine'].lower()
-    assert len(features['cooking_methods']) > 0
+    print(f"   Restaurant: {features.restaurant}")
+    print(f"   Cuisine: {features.cuisine}")
+    print(f"   Cooking methods: {features.cooking_methods}")
+    print(f"   Oil intensity: {features.oil_intensity}")
+    print(f"   Sauce level: {features.sauce_level}")
+    print(f"   Processing level: {features.processing_level}")
+    print(f"   Portion class: {features.portion_class}")
+    print(f"   Price bucket: {features.price_bucket}")
+    
+    assert features.restaurant == "McDonald's"
+    assert features.cuisine in ['american', 'fast_food'] or 'american' in features.cuisine.lower()
+    assert len(features.cooking_methods) > 0
     print("✅ Feature extraction test passed!\n")
 
 
+def test_calibrate_batch():
+    """Test that batch calibration matches per-item calibration."""
+    print("\n" + "=" * 60)
+    print("Test 4: Batch calibration")
+    print("=" * 60)
+    
+    def make_baseline(name, methods, calories):
+        return BaselineEstimate(
+            item_name=name,
+            ingredients=["test"],
+            cooking_methods=methods,
+            sauces=[],
+            portion_class="entree",
+            macros={"calories": calories, "fat": 20.0, "carbs": 40.0, "protein": 15.0, "sodium": 800.0}
+        )
+    
+    baselines = [
+        make_baseline("Fried Chicken", ["fried"], 500.0),
+        make_baseline("Grilled Chicken", ["grilled"], 350.0),
+        make_baseline("Fried Chicken", ["fried"], 520.0),
+    ]
+    metadata = [{"restaurant": "Chain A"}, {"restaurant": "Chain B"}, {"restaurant": "Chain A"}]
+    truths = [
+        {"chain": m["restaurant"], **{k: v * 1.2 for k, v in b["macros"].items()}}
+        for b, m in zip(baselines, metadata)
+    ]
+    
+    model = CalibrationModel()
+    model.train(baselines, truths, metadata)
+    
+    batch = calibrate_batch(baselines, metadata, model=model)
+    single = [calibrate(b, m, model=model) for b, m in zip(baselines, metadata)]
+    
+    assert len(batch) == len(single)
+    for got, expected in zip(batch, single):
+        assert got['confidence'] == expected['confidence']
+        assert got['applied_adjustments'].keys() == expected['applied_adjustments'].keys()
+        for macro, value in expected['adjusted_macros'].items():
+            assert abs(got['adjusted_macros'][macro] - value) < 1e-9
+    print(f"✅ Batch of {len(batch)} matches per-item calibration")
+    print("✅ Batch calibration test passed!\n")
+
+
 if __name__ == "__main__":
     print("\n🧪 Layer 2 Integration Tests\n")
     
@@ -192,6 +233,7 @@ if __name__ == "__main__":
     test_without_model()
     test_feature_extraction()
     test_with_model()
+    test_calibrate_batch()
     
     print("\n" + "=" * 60)
     print("✅ All integration tests completed!")
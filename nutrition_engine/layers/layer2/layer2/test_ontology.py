@@ -0,0 +1,28 @@
+"""
+Tests for the ontology normalizers.
+"""
+
+import pytest
+
+from .ontology import normalize_cooking_method
+
+
+@pytest.mark.parametrize(
+    "method, expected",
+    [
+        ("Grilled", "grilled"),
+        (" flame grilled ", "grilled"),
+        ("deep-fried", "deep_fried"),
+        ("crispy pan fried", "fried"),
+        ("stir", "fried"),
+        # Empty or junk input takes the default, not the longest key
+        ("", "fried"),
+        ("  ", "fried"),
+        ("ok", "fried"),
+        ("d", "fried"),
+        ("unknown", "fried"),
+    ],
+)
+def test_normalize_cooking_method(method, expected):
+    """Canonical names, mapped variants and partial matches; short junk falls back to fried."""
+    assert normalize_cooking_method(method) == expected
@@ -0,0 +1,223 @@
+"""
+Training tests for Layer 2.
+
+Checks that streaming the dataset chunk by chunk trains the same model as
+loading it all at once, and that saved models load back unchanged.
+"""
+
+import pickle
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from layer2 import CalibrationModel, save_model, load_model
+from .config import MACROS
+from .confidence import confidence_score
+from .feature_extraction import extract_features
+from .train_model import (
+    load_restaurant_data,
+    prepare_training_chunk,
+    prepare_training_data,
+    _valid_rows,
+)
+
+
+def _dataset_frame() -> pd.DataFrame:
+    """Small restaurant dataset with a few chains, keyword-bearing names and missing values."""
+    rng = np.random.default_rng(7)
+    chains = ["Chain A", "Chain B", "Taco Bell", "Subway"]
+    names = ["Crispy Chicken", "Grilled Wrap", "Mini Burger", "Combo Platter", "Ranch Salad", "Baked Fish"]
+    n = 40
+    df = pd.DataFrame({
+        "chain": [chains[i % len(chains)] for i in range(n)],
+        "item_name": [names[i % len(names)] for i in range(n)],
+        "calories": rng.uniform(100, 900, n),
+        "fat": rng.uniform(1, 50, n),
+        "carbs": rng.uniform(5, 90, n),
+        "protein": rng.uniform(2, 60, n),
+        "sodium": rng.uniform(100, 2000, n),
+    })
+    df.loc[3, "chain"] = None       # dropped by _valid_rows
+    df.loc[5, "calories"] = np.nan  # dropped by _valid_rows
+    df.loc[8, "fat"] = np.nan       # kept; fat ratio skipped
+    df.loc[11, "sodium"] = 0.0      # kept; sodium ratio skipped
+    return df
+
+
+def _write_dataset(directory: Path, fmt: str) -> str:
+    df = _dataset_frame()
+    path = directory / f"dataset.{fmt}"
+    if fmt == "parquet":
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+def test_chunked_training_matches_train(tmp_path, fmt):
+    """partial_fit over streamed chunks + finalize gives the same multipliers as one train()."""
+    if fmt == "parquet":
+        pytest.importorskip("pyarrow")
+    data_path = _write_dataset(tmp_path, fmt)
+
+    samples = prepare_training_data(load_restaurant_data(data_path), seed=0)
+    full = CalibrationModel()
+    full.train(*samples)
+
+    chunked = CalibrationModel()
+    rng = np.random.default_rng(0)
+    n_chunks = 0
+    for chunk in load_restaurant_data(data_path, chunksize=7):
+        assert len(chunk) <= 7
+        chunked.partial_fit(*prepare_training_chunk(_valid_rows(chunk), rng))
+        n_chunks += 1
+    chunked.finalize()
+    assert n_chunks > 1
+
+    baselines, _, metadata = samples
+    for baseline, meta in zip(baselines, metadata):
+        features = extract_features(baseline, meta)
+        assert chunked.get_multipliers(features) == full.get_multipliers(features)
+    for macro in MACROS:
+        for restaurant in full.level_keys("restaurant"):
+            assert chunked.get_count("restaurant", restaurant, macro) == full.get_count("restaurant", restaurant, macro)
+
+
+def test_partial_fit_after_train():
+    """partial_fit on a finalized model updates multipliers and memoized confidence, like one train()."""
+    df = _dataset_frame()
+    first = prepare_training_data(df.iloc[:20], seed=0)
+    second = prepare_training_data(df.iloc[20:], seed=1)
+    both = [a + b for a, b in zip(first, second)]
+    expected = CalibrationModel()
+    expected.train(*both)
+
+    model = CalibrationModel()
+    model.train(*first)
+    features = [extract_features(b, m) for b, m in zip(both[0], both[2])]
+    # Memoize scores of the first-half model
+    for f in features:
+        confidence_score(model, f, "calories")
+
+    for finalize in (False, True):
+        if not finalize:
+            model.partial_fit(*second)
+        else:
+            model.finalize()
+        for f in features:
+            assert model.get_multipliers(f) == expected.get_multipliers(f)
+            for macro in MACROS:
+                assert model.get_sample_count(f, macro) == expected.get_sample_count(f, macro)
+            assert confidence_score(model, f, "calories") == confidence_score(expected, f, "calories")
+
+
+def _trained_model():
+    """(model trained on _dataset_frame, features to query it with)."""
+    samples = prepare_training_data(_dataset_frame(), seed=0)
+    model = CalibrationModel()
+    model.train(*samples)
+    baselines, _, metadata = samples
+    features = [extract_features(b, m) for b, m in zip(baselines, metadata)]
+    # A restaurant the model has never seen falls back to the other levels
+    features.append(extract_features(baselines[0], {"restaurant": "Unseen Diner"}))
+    return model, features
+
+
+@pytest.mark.parametrize("with_joblib", [True, False])
+def test_save_load_round_trip(tmp_path, monkeypatch, with_joblib):
+    """save_model/load_model keep every multiplier, via joblib mmap or the pickle fallback."""
+    model, features = _trained_model()
+    if not with_joblib:
+        monkeypatch.setitem(sys.modules, "joblib", None)  # import joblib raises ImportError
+    path = str(tmp_path / "model.pkl")
+    save_model(model, path)
+    loaded = load_model(path)
+
+    assert loaded._version == model._version
+    for f in features:
+        assert loaded.get_multipliers(f) == model.get_multipliers(f)
+    for restaurant in model.level_keys("restaurant"):
+        np.testing.assert_array_equal(
+            loaded.get_ratios("restaurant", restaurant, "calories"),
+            model.get_ratios("restaurant", restaurant, "calories"),
+        )
+
+    # A loaded (possibly memory-mapped, read-only) model can keep training
+    more = prepare_training_data(_dataset_frame().head(5), seed=1)
+    loaded.train(*more)
+    model.train(*more)
+    for f in features:
+        assert loaded.get_multipliers(f) == model.get_multipliers(f)
+
+
+def test_save_over_loaded_model(tmp_path):
+    """Saving over a file a live process has memory-mapped leaves that process's model intact."""
+    pytest.importorskip("joblib")
+    model, _ = _trained_model()
+    path = tmp_path / "trained_model.pkl"
+    save_model(model, str(path))
+    replacement = CalibrationModel()
+    replacement.train(*prepare_training_data(_dataset_frame().head(8), seed=2))
+    (tmp_path / "replacement.pkl").write_bytes(pickle.dumps(replacement))
+
+    # A separate process, since reading a truncated mapping kills it with SIGBUS
+    script = textwrap.dedent(f"""
+        import pickle, sys
+        import numpy as np
+        sys.path.insert(0, {str(Path(__file__).parent.parent)!r})
+        from layer2 import load_model, save_model
+        loaded = load_model({str(path)!r})
+        before = {{k: np.array(buf.data) for k, buf in loaded._store.items()}}
+        with open({str(tmp_path / "replacement.pkl")!r}, "rb") as f:
+            save_model(pickle.load(f), {str(path)!r})
+        assert all(np.array_equal(buf.data, before[k]) for k, buf in loaded._store.items())
+        total = lambda m: sum(sum(buf.counts) for buf in m._store.values())
+        assert total(load_model({str(path)!r})) < total(loaded)
+    """)
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["replacement.pkl", "trained_model.pkl"]
+
+
+def test_load_legacy_pickles(tmp_path):
+    """Pickles without _version, or from before the array store, load and score the same."""
+    model, features = _trained_model()
+
+    # Array-store model pickled before _final/_version existed
+    no_version = pickle.loads(pickle.dumps(model))
+    del no_version.__dict__["_version"]
+    del no_version.__dict__["_final"]
+    path = tmp_path / "no_version.pkl"
+    path.write_bytes(pickle.dumps(no_version))
+    with open(path, "rb") as f:
+        loaded = pickle.load(f)
+    assert loaded._version == 0 and loaded._final is None
+    for f in features:
+        assert loaded.get_multipliers(f) == model.get_multipliers(f)
+
+    # Nested level -> key -> macro -> list model from before the array store
+    multipliers = {}
+    for level, key in model._store:
+        multipliers.setdefault(level, {})[key] = {
+            macro: model.get_ratios(level, key, macro).tolist() for macro in MACROS
+        }
+    legacy = CalibrationModel.__new__(CalibrationModel)
+    legacy.__dict__.update({"multipliers": multipliers, "sample_counts": {}})
+    path = tmp_path / "legacy.pkl"
+    path.write_bytes(pickle.dumps(legacy))
+    loaded = load_model(str(path))
+    assert loaded._version == 0
+    for f in features:
+        assert loaded.get_multipliers(f) == model.get_multipliers(f)
+    loaded.finalize()
+    for f in features:
+        assert loaded.get_multipliers(f) == model.get_multipliers(f)
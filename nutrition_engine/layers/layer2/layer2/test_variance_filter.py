@@ -0,0 +1,72 @@
+"""
+Tests for the batched variance screen.
+
+pack_groups + filter_high_variance must pick the same groups, with the same
+variances, as calling np.var on each group in turn.
+"""
+
+import numpy as np
+import pytest
+
+from .variance_filter import filter_high_variance, pack_groups
+
+
+def _per_group(groups, thresh, min_count):
+    """The loop filter_high_variance replaces: one np.var per group."""
+    idx, var = [], []
+    for g, values in enumerate(groups):
+        if len(values) >= min_count:
+            v = np.var(values)
+            if v > thresh:
+                idx.append(g)
+                var.append(v)
+    return idx, var
+
+
+def _groups(seed: int = 0):
+    """Groups of mixed sizes and spreads, with empty groups first, last and back to back."""
+    rng = np.random.default_rng(seed)
+    groups = [np.empty(0)]
+    for i in range(30):
+        size = int(rng.integers(1, 40))
+        groups.append(rng.normal(loc=rng.uniform(0.5, 2.0), scale=rng.uniform(0.05, 0.6), size=size))
+        if i % 7 == 0:
+            groups.extend([np.empty(0), np.empty(0)])
+    groups.append(np.array([1.3]))                       # single value: variance 0
+    groups.append(np.array([0.0, 0.0, 1.0, 1.0, 0.0, 1.0, 1.0, 0.0]))  # variance exactly 0.25
+    groups.append(np.full(6, 2.5))                       # constant group
+    groups.append(np.empty(0))
+    return groups
+
+
+def test_pack_groups():
+    """offsets bound each group in flat, empty groups included."""
+    groups = _groups()
+    flat, offsets = pack_groups(groups)
+    assert flat.dtype == np.float64
+    assert offsets[0] == 0 and offsets[-1] == len(flat)
+    assert len(offsets) == len(groups) + 1
+    for g, values in enumerate(groups):
+        np.testing.assert_array_equal(flat[offsets[g]:offsets[g + 1]], values)
+
+    flat, offsets = pack_groups([])
+    assert flat.size == 0 and offsets.tolist() == [0]
+
+
+@pytest.mark.parametrize("thresh, min_count", [(0.1, 5), (0.25, 1), (0.0, 1), (0.0, 8), (10.0, 5)])
+def test_filter_high_variance_matches_np_var(thresh, min_count):
+    """Same group indices and variances as the per-group np.var loop."""
+    groups = _groups()
+    expected_idx, expected_var = _per_group(groups, thresh, min_count)
+
+    idx, var = filter_high_variance(*pack_groups(groups), thresh, min_count=min_count)
+    assert idx.tolist() == expected_idx
+    np.testing.assert_allclose(var, expected_var, rtol=1e-12, atol=1e-15)
+
+
+@pytest.mark.parametrize("groups", [[], [np.empty(0)], [np.empty(0)] * 3, [np.array([4.0])]])
+def test_filter_high_variance_nothing_to_keep(groups):
+    """No groups, only empty groups, or one value give empty results of the right dtypes."""
+    idx, var = filter_high_variance(*pack_groups(groups), 0.0, min_count=1)
+    assert idx.size == 0 and var.size == 0
+    assert idx.dtype == np.int64 and var.dtype == np.float64
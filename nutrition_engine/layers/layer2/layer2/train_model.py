@@ -8,118 +8,265 @@ This script:
 4. Saves the trained model
 """
 
+import heapq
+import numpy as np
 import pandas as pd
-import pickle
 import os
+import re
+from functools import lru_cache
 import sys
 from pathlib import Path
+from typing import List
 
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from layer2 import CalibrationModel, set_model
+from layer2 import CalibrationModel, set_model, save_model
 from .schemas import BaselineEstimate, RestaurantTruth
 
 
-def load_restaurant_data(data_path: str = "data/processed/restaurant_nutrition_dataset.csv"):
-    """Load restaurant nutrition data from Part B."""
+# Columns used for training; everything else in the CSV is skipped at parse time
+TRAINING_COLUMNS = ("chain", "item_name", "calories", "fat", "carbs", "protein", "sodium")
+NUTRITION_COLUMNS = ("calories", "fat", "carbs", "protein", "sodium")
+
+
+def _is_parquet(data_path: str) -> bool:
+    return str(data_path).endswith(".parquet")
+
+
+def _training_usecols(data_path: str):
+    """TRAINING_COLUMNS if the CSV has all of them, else None (keep every column)."""
+    header = pd.read_csv(data_path, nrows=0).columns
+    return list(TRAINING_COLUMNS) if set(TRAINING_COLUMNS).issubset(header) else None
+
+
+def convert_to_parquet(csv_path: str, parquet_path: str = None) -> str:
+    """
+    Write the training columns of a CSV dataset to Parquet once.
+    
+    Later runs can pass the .parquet path as data_path and skip the CSV parse.
+    Needs pyarrow or fastparquet installed.
+    
+    Returns:
+        Path of the written Parquet file
+    """
+    if not os.path.exists(csv_path):
+        raise FileNotFoundError(f"Dataset not found at {csv_path}")
+    
+    parquet_path = parquet_path or os.path.splitext(csv_path)[0] + ".parquet"
+    df = pd.read_csv(csv_path, usecols=_training_usecols(csv_path))
+    df.to_parquet(parquet_path, index=False)
+    print(f"✅ Wrote {len(df)} rows to {parquet_path}")
+    return parquet_path
+
+
+def _iter_chunks(data_path: str, chunksize: int):
+    """
+    Yield raw DataFrame chunks of at most chunksize rows.
+    
+    Parquet is streamed record batch by record batch (needs pyarrow), so only
+    one chunk is ever materialized.
+    """
+    if _is_parquet(data_path):
+        import pyarrow.parquet as pq
+        
+        parquet_file = pq.ParquetFile(data_path)
+        names = parquet_file.schema_arrow.names
+        columns = list(TRAINING_COLUMNS) if set(TRAINING_COLUMNS).issubset(names) else None
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+        return
+    
+    yield from pd.read_csv(data_path, usecols=_training_usecols(data_path), chunksize=chunksize)
+
+
+def load_restaurant_data(
+    data_path: str = "data/processed/restaurant_nutrition_dataset.csv",
+    max_samples: int = None,
+    chunksize: int = None
+):
+    """
+    Load restaurant nutrition data from Part B.
+    
+    Only TRAINING_COLUMNS are parsed when the CSV has all of them (otherwise
+    every column is kept so prepare_training_data can suggest matches). With
+    max_samples, the CSV is read in chunks and reading stops once that many
+    valid rows have been seen. A .parquet data_path (see convert_to_parquet)
+    is loaded column-wise instead.
+    
+    With chunksize, returns an iterator of DataFrame chunks instead of one
+    DataFrame, so large datasets never have to fit in memory at once.
+    """
     if not os.path.exists(data_path):
         raise FileNotFoundError(f"Dataset not found at {data_path}")
     
-    df = pd.read_csv(data_path)
+    if chunksize:
+        return _iter_chunks(data_path, chunksize)
+    
+    if _is_parquet(data_path):
+        df = pd.read_parquet(data_path)
+        print(f"✅ Loaded {len(df)} rows from {data_path}")
+        return df
+    
+    usecols = _training_usecols(data_path)
+    if max_samples:
+        chunks = []
+        n_valid = 0
+        for chunk in pd.read_csv(data_path, usecols=usecols, chunksize=max_samples):
+            chunks.append(chunk)
+            n_valid += len(_valid_rows(chunk))
+            if n_valid >= max_samples:
+                break
+        df = pd.concat(chunks) if chunks else pd.read_csv(data_path, usecols=usecols)
+    else:
+        df = pd.read_csv(data_path, usecols=usecols)
     print(f"✅ Loaded {len(df)} rows from {data_path}")
     print(f"   Columns: {', '.join(df.columns[:10])}...")
     
     return df
 
 
-def create_simulated_baseline(truth_row: pd.Series) -> BaselineEstimate:
+# Per-macro Layer 1 noise ranges, in MACROS order
+_NOISE_LOW = np.array([0.90, 0.85, 0.90, 0.88, 0.80])
+_NOISE_HIGH = np.array([1.10, 1.15, 1.10, 1.12, 1.20])  # fat and sodium are harder to estimate
+
+# First matching pattern wins, as in an if/elif chain
+_COOKING_PATTERNS = (
+    ("fried|crispy|fries", "deep_fried"),
+    ("grilled|flame", "grilled"),
+    ("baked|oven", "baked"),
+    ("roasted|tandoor", "roasted"),
+)
+_SAUCE_PATTERN = "sauce|mayo|ranch|dressing"
+_PORTION_PATTERNS = (
+    ("snack|small|mini", "snack"),
+    ("platter|combo|large", "platter"),
+)
+
+# Every keyword above in one alternation. The lookahead reports a match at
+# every position, so overlapping keywords are all found in a single scan.
+_KEYWORD_RE = re.compile(
+    "(?=(" + "|".join(
+        [p for p, _ in _COOKING_PATTERNS] + [_SAUCE_PATTERN] + [p for p, _ in _PORTION_PATTERNS]
+    ) + "))"
+)
+_SAUCE_KEYWORDS = frozenset(_SAUCE_PATTERN.split("|"))
+
+
+def _nutrition_matrix(df: pd.DataFrame) -> np.ndarray:
+    """(N, 5) float64 truth values in MACROS order; absent columns are 0."""
+    columns = [
+        df[col].to_numpy(dtype=np.float64) if col in df.columns else np.zeros(len(df))
+        for col in NUTRITION_COLUMNS
+    ]
+    return np.column_stack(columns) if columns else np.zeros((len(df), 0))
+
+
+def _first_label(found: set, patterns, default: str) -> str:
+    """Label of the first pattern with a keyword in found, else default."""
+    for pattern, label in patterns:
+        if not found.isdisjoint(pattern.split("|")):
+            return label
+    return default
+
+
+@lru_cache(maxsize=None)
+def _keyword_labels(found: frozenset) -> tuple:
+    """(cooking method, has sauce, portion class) for a set of matched keywords."""
+    return (
+        _first_label(found, _COOKING_PATTERNS, "fried"),  # Default
+        not found.isdisjoint(_SAUCE_KEYWORDS),
+        _first_label(found, _PORTION_PATTERNS, "entree"),
+    )
+
+
+def _draw_noise(rng: np.random.Generator, n: int) -> np.ndarray:
+    """(n, 5) multipliers simulating Layer 1 being ~10-20% off, with different accuracies per macro."""
+    return _NOISE_LOW + (_NOISE_HIGH - _NOISE_LOW) * rng.random((n, len(NUTRITION_COLUMNS)))
+
+
+def create_simulated_baselines(
+    df: pd.DataFrame,
+    rng: np.random.Generator = None,
+    nutrition: np.ndarray = None,
+    noise: np.ndarray = None
+) -> List[BaselineEstimate]:
     """
-    Create a simulated Layer 1 baseline estimate.
+    Create simulated Layer 1 baseline estimates for every row of df.
     
-    In production, this would come from Layer 1.
-    For now, we simulate by adding some noise/variation to the truth data.
+    In production, these would come from Layer 1.
+    For now, we simulate by adding some noise/variation to the truth data:
+    all noise is drawn in one (N, 5) block and keyword inference scans each
+    distinct item name once. nutrition is df's _nutrition_matrix and noise
+    its _draw_noise block, when the caller already has them.
     """
-    # Simulate Layer 1 being ~10-20% off on average
-    import random
-    noise_factor = random.uniform(0.85, 1.15)  # ±15% variation
-    
-    # Simulate different accuracies for different macros
-    macro_noise = {
-        "calories": random.uniform(0.90, 1.10),
-        "fat": random.uniform(0.85, 1.15),  # Fat is harder to estimate
-        "carbs": random.uniform(0.90, 1.10),
-        "protein": random.uniform(0.88, 1.12),
-        "sodium": random.uniform(0.80, 1.20),  # Sodium varies a lot
-    }
-    
-    # Infer cooking method from item name
-    item_name = str(truth_row.get("item_name", "")).lower()
-    cooking_methods = []
-    
-    if any(word in item_name for word in ["fried", "crispy", "fries"]):
-        cooking_methods.append("deep_fried")
-    elif any(word in item_name for word in ["grilled", "flame"]):
-        cooking_methods.append("grilled")
-    elif any(word in item_name for word in ["baked", "oven"]):
-        cooking_methods.append("baked")
-    elif any(word in item_name for word in ["roasted", "tandoor"]):
-        cooking_methods.append("roasted")
-    else:
-        cooking_methods.append("fried")  # Default
-    
-    # Infer sauces
-    sauces = []
-    if any(word in item_name for word in ["sauce", "mayo", "ranch", "dressing"]):
-        sauces.append("sauce")
-    
-    # Infer portion class
-    portion_class = "entree"
-    if any(word in item_name for word in ["snack", "small", "mini"]):
-        portion_class = "snack"
-    elif any(word in item_name for word in ["platter", "combo", "large"]):
-        portion_class = "platter"
-    
-    # Get nutrition values
-    calories = float(truth_row.get("calories", 0) or 0)
-    fat = float(truth_row.get("fat", 0) or 0)
-    carbs = float(truth_row.get("carbs", 0) or 0)
-    protein = float(truth_row.get("protein", 0) or 0)
-    sodium = float(truth_row.get("sodium", 0) or 0)
-    
-    # Create baseline with noise
-    baseline = BaselineEstimate(
-        item_name=str(truth_row.get("item_name", "Unknown")),
-        ingredients=[],  # Would come from Layer 1
-        cooking_methods=cooking_methods,
-        sauces=sauces,
-        portion_class=portion_class,
-        macros={
-            "calories": max(0, calories * macro_noise["calories"]),
-            "fat": max(0, fat * macro_noise["fat"]),
-            "carbs": max(0, carbs * macro_noise["carbs"]),
-            "protein": max(0, protein * macro_noise["protein"]),
-            "sodium": max(0, sodium * macro_noise["sodium"]),
-        }
-    )
+    n = len(df)
+    
+    if noise is None:
+        noise = _draw_noise(rng if rng is not None else np.random.default_rng(), n)
+    # fmax so missing (NaN) values clamp to 0
+    if nutrition is None:
+        nutrition = _nutrition_matrix(df)
+    macros = np.fmax(nutrition * noise, 0.0).tolist()
+    
+    # Infer cooking method, sauces and portion class from item name
+    raw_names = df["item_name"].astype(str) if "item_name" in df.columns else pd.Series([""] * n, index=df.index)
+    codes, unique_names = pd.factorize(raw_names.str.lower())
+    # Few distinct keyword sets occur, so labels are resolved once per set
+    unique_labels = [_keyword_labels(frozenset(_KEYWORD_RE.findall(name))) for name in unique_names]
+    labels = [unique_labels[code] for code in codes]
+    cooking = [method for method, _, _ in labels]
+    has_sauce = [sauce for _, sauce, _ in labels]
+    portions = [portion for _, _, portion in labels]
+    
+    return [
+        BaselineEstimate(
+            item_name=item_name,
+            ingredients=[],  # Would come from Layer 1
+            cooking_methods=[method],
+            sauces=["sauce"] if sauce else [],
+            portion_class=portion,
+            macros=dict(zip(NUTRITION_COLUMNS, row)),
+        )
+        for item_name, method, sauce, portion, row in zip(
+            raw_names.tolist(), cooking, has_sauce, portions, macros
+        )
+    ]
+
+
+def _valid_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """Rows with a chain, an item name and at least the first available nutrition value."""
+    valid_rows = df.dropna(subset=["chain", "item_name"])
+    
+    # Filter rows with at least some nutrition data
+    available_nutrition = [col for col in NUTRITION_COLUMNS if col in df.columns]
+    
+    if available_nutrition:
+        valid_rows = valid_rows.dropna(subset=available_nutrition[:1])  # At least one nutrition value
     
-    return baseline
+    return valid_rows
 
 
-def prepare_training_data(df: pd.DataFrame, max_samples: int = None):
+def prepare_training_data(
+    df: pd.DataFrame,
+    max_samples: int = None,
+    seed: int = None,
+    n_jobs: int = 1
+):
     """
     Prepare training data from restaurant dataset.
     
     Args:
         df: Restaurant nutrition dataframe
         max_samples: Maximum number of samples to use (None = all)
+        seed: Seed for the simulated baseline noise (None = random)
+        n_jobs: joblib workers building the samples (-1 = all cores)
     
     Returns:
         Tuple of (baseline_estimates, restaurant_truths, restaurant_metadata)
     """
     # Filter out rows with missing nutrition data
-    required_cols = ["chain", "item_name", "calories", "fat", "carbs", "protein", "sodium"]
-    missing_cols = [col for col in required_cols if col not in df.columns]
+    missing_cols = [col for col in TRAINING_COLUMNS if col not in df.columns]
     
     if missing_cols:
         print(f"⚠️  Missing columns: {missing_cols}")
@@ -131,14 +278,7 @@ def prepare_training_data(df: pd.DataFrame, max_samples: int = None):
                 print(f"   Found similar for '{col}': {similar}")
     
     # Filter valid rows
-    valid_rows = df.dropna(subset=["chain", "item_name"])
-    
-    # Filter rows with at least some nutrition data
-    nutrition_cols = ["calories", "fat", "carbs", "protein", "sodium"]
-    available_nutrition = [col for col in nutrition_cols if col in df.columns]
-    
-    if available_nutrition:
-        valid_rows = valid_rows.dropna(subset=available_nutrition[:1])  # At least one nutrition value
+    valid_rows = _valid_rows(df)
     
     if max_samples:
         valid_rows = valid_rows.head(max_samples)
@@ -146,96 +286,152 @@ def prepare_training_data(df: pd.DataFrame, max_samples: int = None):
     print(f"\n📊 Preparing training data:")
     print(f"   Valid rows: {len(valid_rows)}")
     print(f"   Unique chains: {valid_rows['chain'].nunique()}")
-    print(f"   Chains: {', '.join(sorted(valid_rows['chain'].unique())[:10])}...")
+    print(f"   Chains: {', '.join(heapq.nsmallest(10, valid_rows['chain'].unique()))}...")
+    
+    rng = np.random.default_rng(seed)
+    if n_jobs != 1:
+        return _prepare_parallel(valid_rows, rng, n_jobs)
+    return prepare_training_chunk(valid_rows, rng)
+
+
+def _prepare_parallel(valid_rows: pd.DataFrame, rng: np.random.Generator, n_jobs: int):
+    """prepare_training_chunk over contiguous row slices in joblib worker processes."""
+    try:
+        from joblib import Parallel, delayed, effective_n_jobs
+    except ImportError:
+        return prepare_training_chunk(valid_rows, rng)
+    
+    # Noise is drawn here in one block, so a seed gives the same samples for any n_jobs
+    noise = _draw_noise(rng, len(valid_rows))
+    bounds = np.linspace(0, len(valid_rows), effective_n_jobs(n_jobs) + 1).astype(int).tolist()
+    parts = Parallel(n_jobs=n_jobs)(
+        delayed(prepare_training_chunk)(valid_rows.iloc[start:stop], noise=noise[start:stop])
+        for start, stop in zip(bounds[:-1], bounds[1:])
+    )
+    return tuple([item for part in parts for item in part[i]] for i in range(3))
+
+
+def prepare_training_chunk(
+    valid_rows: pd.DataFrame,
+    rng: np.random.Generator = None,
+    noise: np.ndarray = None
+):
+    """
+    Build training triples for rows that already passed _valid_rows.
     
-    baseline_estimates = []
-    restaurant_truths = []
-    restaurant_metadata = []
+    Pass the same rng for every chunk of a dataset and the simulated noise
+    matches a single prepare_training_data call over all rows (or pass the
+    chunk's slice of a pre-drawn noise block).
     
-    for _, row in valid_rows.iterrows():
-        # Create baseline estimate
-        baseline = create_simulated_baseline(row)
-        baseline_estimates.append(baseline)
-        
-        # Create restaurant truth
-        truth = RestaurantTruth(
-            chain=str(row.get("chain", "Unknown")),
-            item_name=str(row.get("item_name", "Unknown")),
-            calories=float(row.get("calories", 0) or 0),
-            fat=float(row.get("fat", 0) or 0),
-            carbs=float(row.get("carbs", 0) or 0),
-            protein=float(row.get("protein", 0) or 0),
-            sodium=float(row.get("sodium", 0) or 0),
-        )
-        restaurant_truths.append(truth)
-        
-        # Create metadata
-        restaurant_metadata.append({
-            "restaurant": str(row.get("chain", "Unknown"))
-        })
+    Returns:
+        Tuple of (baseline_estimates, restaurant_truths, restaurant_metadata)
+    """
+    # One float64 block feeds both the simulated baselines and the truths
+    nutrition = _nutrition_matrix(valid_rows)
+    baseline_estimates = create_simulated_baselines(valid_rows, rng, nutrition, noise)
+    
+    # Truths keep the raw values (NaN included); absent columns are 0
+    chains = valid_rows["chain"].astype(str).tolist()
+    truth_values = nutrition.tolist()
+    restaurant_truths = [
+        RestaurantTruth(chain=chain, item_name=baseline["item_name"], **dict(zip(NUTRITION_COLUMNS, row)))
+        for chain, baseline, row in zip(chains, baseline_estimates, truth_values)
+    ]
+    restaurant_metadata = [{"restaurant": chain} for chain in chains]
     
     return baseline_estimates, restaurant_truths, restaurant_metadata
 
 
+def _train_chunked(data_path: str, chunksize: int, max_samples: int = None) -> CalibrationModel:
+    """Train chunk by chunk; only one chunk's rows are held in memory at a time."""
+    print(f"\n🔧 Streaming {data_path} in chunks of {chunksize} rows...")
+    model = CalibrationModel()
+    rng = np.random.default_rng()
+    n_samples = 0
+    
+    for chunk in load_restaurant_data(data_path, chunksize=chunksize):
+        valid_rows = _valid_rows(chunk)
+        if max_samples:
+            valid_rows = valid_rows.head(max_samples - n_samples)
+        if len(valid_rows):
+            model.partial_fit(*prepare_training_chunk(valid_rows, rng))
+            n_samples += len(valid_rows)
+            print(f"   {n_samples} samples...")
+        if max_samples and n_samples >= max_samples:
+            break
+    
+    if not n_samples:
+        raise ValueError("No valid training data found!")
+    
+    model.finalize()
+    print(f"   Trained calibration model on {n_samples} samples")
+    return model
+
+
 def train_and_save_model(
     data_path: str = "data/processed/restaurant_nutrition_dataset.csv",
     model_path: str = "layer2/trained_model.pkl",
-    max_samples: int = None
+    max_samples: int = None,
+    chunksize: int = None,
+    n_jobs: int = 1
 ):
     """
     Train the calibration model and save it.
     
     Args:
-        data_path: Path to restaurant nutrition dataset
+        data_path: Path to restaurant nutrition dataset (.csv or .parquet)
         model_path: Path to save trained model
         max_samples: Maximum number of training samples (None = all)
+        chunksize: Stream the dataset in chunks of this many rows, training
+            each one with partial_fit (None = load everything at once)
+        n_jobs: joblib workers preparing the samples when not streaming
+            (-1 = all cores)
     """
     print("=" * 60)
     print("Layer 2 Model Training")
     print("=" * 60)
     
-    # Load data
-    df = load_restaurant_data(data_path)
-    
-    # Prepare training data
-    baseline_estimates, restaurant_truths, restaurant_metadata = prepare_training_data(
-        df, max_samples=max_samples
-    )
-    
-    if not baseline_estimates:
-        raise ValueError("No valid training data found!")
-    
-    # Train model
-    print(f"\n🔧 Training calibration model on {len(baseline_estimates)} samples...")
-    model = CalibrationModel()
-    model.train(baseline_estimates, restaurant_truths, restaurant_metadata)
+    if chunksize:
+        model = _train_chunked(data_path, chunksize, max_samples)
+    else:
+        # Load data
+        df = load_restaurant_data(data_path, max_samples=max_samples)
+        
+        # Prepare training data
+        baseline_estimates, restaurant_truths, restaurant_metadata = prepare_training_data(
+            df, max_samples=max_samples, n_jobs=n_jobs
+        )
+        
+        if not baseline_estimates:
+            raise ValueError("No valid training data found!")
+        
+        # Train model
+        print(f"\n🔧 Training calibration model on {len(baseline_estimates)} samples...")
+        model = CalibrationModel()
+        model.train(baseline_estimates, restaurant_truths, restaurant_metadata)
     
     # Set as global model
     set_model(model)
     
     # Save model
     os.makedirs(os.path.dirname(model_path), exist_ok=True)
-    with open(model_path, 'wb') as f:
-        pickle.dump(model, f)
+    save_model(model, model_path)
     
     print(f"✅ Model trained and saved to {model_path}")
     
     # Print statistics
     print(f"\n📊 Model Statistics:")
-    print(f"   Restaurants learned: {len(model.multipliers['restaurant'])}")
-    print(f"   Cuisines learned: {len(model.multipliers['cuisine'])}")
-    print(f"   Cooking methods learned: {len(model.multipliers['cooking_method'])}")
+    print(f"   Restaurants learned: {len(model.level_keys('restaurant'))}")
+    print(f"   Cuisines learned: {len(model.level_keys('cuisine'))}")
+    print(f"   Cooking methods learned: {len(model.level_keys('cooking_method'))}")
     
     # Show sample counts for a few restaurants
     print(f"\n   Sample counts (top 5 restaurants):")
-    restaurant_counts = {}
-    for restaurant, macros in model.sample_counts['restaurant'].items():
-        total = sum(macros.values())
-        if total > 0:
-            restaurant_counts[restaurant] = total
-    
-    for restaurant, count in sorted(restaurant_counts.items(), key=lambda x: x[1], reverse=True)[:5]:
-        print(f"     {restaurant}: {count} samples")
+    restaurants, counts = model.sample_count_matrix('restaurant')
+    totals = counts.sum(axis=1)
+    for i in np.argsort(-totals, kind='stable')[:5]:
+        if totals[i] > 0:
+            print(f"     {restaurants[i]}: {totals[i]} samples")
     
     return model
 
@@ -262,14 +458,37 @@ if __name__ == "__main__":
         default=None,
         help="Maximum number of training samples (None = all)"
     )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=None,
+        help="Stream the dataset in chunks of this many rows (None = load all at once)"
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Parallel workers preparing the training samples (-1 = all cores)"
+    )
+    parser.add_argument(
+        "--to-parquet",
+        action="store_true",
+        help="Convert --data to Parquet next to the CSV and exit"
+    )
     
     args = parser.parse_args()
     
     try:
+        if args.to_parquet:
+            convert_to_parquet(args.data)
+            sys.exit(0)
+        
         model = train_and_save_model(
             data_path=args.data,
             model_path=args.output,
-            max_samples=args.max_samples
+            max_samples=args.max_samples,
+            chunksize=args.chunksize,
+            n_jobs=args.jobs
         )
         print("\n✅ Training complete!")
     except Exception as e:
@@ -0,0 +1,52 @@
+"""
+Batched variance screening over packed ratio groups.
+
+Groups are packed CSR-style: one flat float64 array plus an offsets array,
+with group g stored at flat[offsets[g]:offsets[g + 1]].
+"""
+
+from typing import List, Tuple
+
+import numpy as np
+
+
+def pack_groups(groups: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Pack 1-D arrays into (flat, offsets)."""
+    offsets = np.zeros(len(groups) + 1, dtype=np.int64)
+    if groups:
+        np.cumsum([len(g) for g in groups], out=offsets[1:])
+        flat = np.concatenate(groups).astype(np.float64, copy=False)
+    else:
+        flat = np.empty(0, dtype=np.float64)
+    return flat, offsets
+
+
+def filter_high_variance(
+    flat: np.ndarray,
+    offsets: np.ndarray,
+    thresh: float,
+    min_count: int = 5,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find groups with at least min_count values and population variance > thresh.
+    
+    All group means and variances come from two np.add.reduceat sweeps over
+    flat, rather than one NumPy call per group.
+    
+    Returns:
+        (group indices, their variances), in group order
+    """
+    counts = np.diff(offsets)
+    nonempty = np.flatnonzero(counts)
+    if nonempty.size == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    
+    # Empty groups add no values, so the non-empty segments tile flat exactly
+    starts = offsets[:-1][nonempty]
+    n = counts[nonempty]
+    means = np.add.reduceat(flat, starts) / n
+    dev = flat - np.repeat(means, n)
+    variances = np.add.reduceat(dev * dev, starts) / n
+    
+    keep = (n >= min_count) & (variances > thresh)
+    return nonempty[keep], variances[keep]
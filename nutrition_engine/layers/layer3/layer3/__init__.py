@@ -85,7 +85,8 @@ def refine(
         dish_id: optional; if this dish is in the training set, neighbor_index is used
 
     If initial_macros is None, a default is derived from the mean of top similar dishes
-    (so refinement still has a base to adjust).
+    (so refinement still has a base to adjust). Names are stripped and lowercased once
+    here; embedding and coverage then use them as-is.
 
     Returns:
         RefineResult with refined_macros, confidence, similar_dish_ids, etc.
@@ -101,7 +102,15 @@ def refine(
     macro_delta_stats = artifacts["macro_delta_stats"]
     confidence_params = artifacts["confidence_params"]
 
-    mean_emb = np.mean(list(ing_emb.values()), axis=0) if ing_emb else None
+    ingredients = _embeddings.normalize_ingredients(ingredients)
+    cooking_methods = _embeddings.normalize_cooking_methods(cooking_methods)
+    portion_class = _embeddings.normalize_portion(portion_class)
+
+    # Computed once by loader.load_all; only hand-built artifact dicts lack it
+    if "ingredient_embeddings_mean" in artifacts:
+        mean_emb = artifacts["ingredient_embeddings_mean"]
+    else:
+        mean_emb = np.mean(list(ing_emb.values()), axis=0) if ing_emb else None
 
     query_embedding = _embeddings.embed_dish(
         ingredients,
@@ -110,6 +119,9 @@ def refine(
         portion_class,
         ing_emb,
         mean_embedding=mean_emb,
+        ingredient_matrix=artifacts.get("ingredient_embeddings_matrix"),
+        ingredient_key_to_idx=artifacts.get("ingredient_key_to_idx"),
+        normalized=True,
     )
 
     # Similar dishes: use neighbor_index if dish_id is known, else top-k by embedding
@@ -125,7 +137,9 @@ def refine(
             for n in neighbor_index[str(dish_id)]
         ]
     else:
-        top = _similarity.top_k_similar(query_embedding, dish_emb, k=top_k)
+        top = _similarity.top_k_similar(
+            query_embedding, dish_emb, k=top_k, dish_index=artifacts.get("dish_index")
+        )
         similar_dishes = [{"dish_id": t["dish_id"], "similarity": t["similarity"], "macros": t["macros"]} for t in top]
 
     # Base macros: use initial_macros or mean of similar dishes
@@ -142,7 +156,11 @@ def refine(
             base_macros = {k: 0.0 for k in macro_keys}
 
     # Refine: use learned model if present, else rule-based (macro_deltas or neighbor macros)
-    learned = _learned_refinement.load_model(artifacts_dir)
+    # Loaded once by loader.load_all; only hand-built artifact dicts lack it
+    if "learned_model" in artifacts:
+        learned = artifacts["learned_model"]
+    else:
+        learned = _learned_refinement.load_model(artifacts_dir)
     if learned is not None:
         refined = _learned_refinement.predict(
             query_embedding,
@@ -152,11 +170,12 @@ def refine(
             learned,
             macro_delta_stats=macro_delta_stats,
             clamp_to_bounds=True,
+            dish_index=artifacts.get("dish_index"),
         )
     elif similar_dishes and "macro_deltas" in similar_dishes[0]:
         refined = _refinement.refine_macros_from_deltas(
             base_macros,
-            [{"similarity": d["similarity"], "macro_deltas": d["macro_deltas"]} for d in similar_dishes],
+            similar_dishes,  # only "similarity" and "macro_deltas" are read
             macro_delta_stats,
             weight_by_similarity=True,
         )
@@ -170,8 +189,12 @@ def refine(
 
     # Confidence
     avg_similarity = sum(d["similarity"] for d in similar_dishes) / len(similar_dishes) if similar_dishes else 0.0
-    known_ings = set(ing_emb.keys())
-    coverage = _confidence.ingredient_coverage(ingredients, known_ings)
+    coverage = _confidence.ingredient_coverage(
+        ingredients,
+        ing_emb.keys(),
+        known_normalized=artifacts.get("known_ingredients_normalized"),
+        normalized=True,
+    )
     conf = _confidence.compute_confidence(avg_similarity, coverage, confidence_params)
 
     return RefineResult(
@@ -3,7 +3,22 @@ Confidence from similarity, variance penalty, and ingredient coverage (lookup on
 """
 from __future__ import annotations
 
-import numpy as np
+from bisect import bisect_right
+
+
+def _interp(x: float, xp: list[float], fp: list[float]) -> float:
+    """Scalar np.interp(x, xp, fp) in plain Python (xp ascending); skips NumPy dispatch per call."""
+    if len(xp) != len(fp):
+        raise ValueError("fp and xp are not of the same length.")
+    if x != x:  # NaN
+        return float(x)
+    if x < xp[0]:
+        return float(fp[0])
+    if x >= xp[-1]:
+        return float(fp[-1])
+    j = bisect_right(xp, x) - 1
+    slope = (fp[j + 1] - fp[j]) / (xp[j + 1] - xp[j])
+    return float(slope * (x - xp[j]) + fp[j])
 
 
 def similarity_to_confidence(
@@ -14,13 +29,11 @@ def similarity_to_confidence(
     """Interpolate confidence from similarity using bin_edges and confidence_at_bin."""
     if not bin_edges or not confidence_at_bin:
         return 0.5
-    bins = np.array(bin_edges)
-    vals = np.array(confidence_at_bin)
-    if similarity <= bins[0]:
-        return float(vals[0])
-    if similarity >= bins[-1]:
-        return float(vals[-1])
-    return float(np.interp(similarity, bins, vals))
+    if similarity <= bin_edges[0]:
+        return float(confidence_at_bin[0])
+    if similarity >= bin_edges[-1]:
+        return float(confidence_at_bin[-1])
+    return _interp(similarity, bin_edges, confidence_at_bin)
 
 
 def coverage_penalty(
@@ -31,7 +44,7 @@ def coverage_penalty(
     """Interpolate penalty from ingredient coverage (0 = no penalty, 1 = max penalty when coverage low)."""
     if not bins or not penalties:
         return 0.0
-    return float(np.interp(coverage, bins, penalties))
+    return _interp(coverage, bins, penalties)
 
 
 def compute_confidence(
@@ -55,10 +68,23 @@ def compute_confidence(
     return max(0.0, min(1.0, base - pen))
 
 
-def ingredient_coverage(ingredients: list[str], known_ingredients: set[str]) -> float:
-    """Fraction of ingredients that appear in known_ingredients (e.g. embedding keys)."""
+def ingredient_coverage(
+    ingredients: list[str],
+    known_ingredients: set[str],
+    known_normalized: frozenset[str] | None = None,
+    normalized: bool = False,
+) -> float:
+    """
+    Fraction of ingredients that appear in known_ingredients (e.g. embedding keys).
+    Pass known_normalized (already stripped/lowercased, see loader.load_all) to skip
+    normalizing the whole vocabulary on every call, and normalized=True when ingredients
+    are already stripped/lowercased.
+    """
     if not ingredients:
         return 1.0
-    ings = {str(x).strip().lower() for x in ingredients}
-    known = {str(x).strip().lower() for x in known_ingredients}
+    ings = set(ingredients) if normalized else {str(x).strip().lower() for x in ingredients}
+    if known_normalized is not None:
+        known = known_normalized
+    else:
+        known = {str(x).strip().lower() for x in known_ingredients}
     return sum(1 for i in ings if i in known) / len(ings)
@@ -0,0 +1,35 @@
+"""
+Convert Layer 3 pickled artifacts (ingredient_embeddings.pkl, dish_embeddings.pkl,
+neighbor_index.pkl) into memory-mappable .npy arrays that loader.load_all prefers.
+With --onnx, also export refinement_model.joblib to refinement_model.onnx (needs skl2onnx).
+
+Usage:
+    python -m layers.layer3.layer3.convert_artifacts --artifacts artifacts/layer3 [--onnx]
+"""
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+
+from .learned_refinement import export_onnx
+from .loader import DEFAULT_ARTIFACTS_DIR, export_arrays
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert Layer 3 pickle artifacts to .npy arrays")
+    parser.add_argument(
+        "--artifacts",
+        type=Path,
+        default=DEFAULT_ARTIFACTS_DIR,
+        help="Directory containing the Layer 3 pickle artifacts",
+    )
+    parser.add_argument(
+        "--onnx",
+        action="store_true",
+        help="Also export the learned refinement model to ONNX",
+    )
+    args = parser.parse_args()
+    out = export_arrays(args.artifacts)
+    print(f"Wrote arrays to {out}")
+    if args.onnx:
+        print(f"Wrote {export_onnx(args.artifacts)}")
@@ -14,18 +14,44 @@ METHOD_TO_IDX = {m: i for i, m in enumerate(COOKING_METHODS_ORDER)}
 PORTION_TO_IDX = {p: i for i, p in enumerate(PORTION_CLASSES)}
 
 
-def encode_cooking_methods(methods: list[str] | str) -> np.ndarray:
+def _normalize(name: str) -> str:
+    """name.strip().lower(), skipping the copies when name is already clean."""
+    if name.islower() and name == name.strip():
+        return name
+    return name.strip().lower()
+
+
+def normalize_ingredients(ingredients: list[Any]) -> list[str]:
+    """Stripped, lowercased ingredient names (the form ingredient_embeddings keys use)."""
+    return [_normalize(x if isinstance(x, str) else str(x)) for x in ingredients]
+
+
+def normalize_cooking_methods(methods: list[str] | str) -> list[str]:
+    """Stripped, lowercased cooking methods; non-strings become "other"."""
+    return [
+        _normalize(m) if isinstance(m, str) else "other"
+        for m in (methods if isinstance(methods, (list, tuple)) else [methods])
+    ]
+
+
+def normalize_portion(portion_class: str | None) -> str:
+    """Stripped, lowercased portion class; empty means "medium"."""
+    return _normalize(portion_class or "medium")
+
+
+def encode_cooking_methods(methods: list[str] | str, *, normalized: bool = False) -> np.ndarray:
     vec = np.zeros(len(COOKING_METHODS_ORDER), dtype=np.float32)
-    for m in (methods if isinstance(methods, (list, tuple)) else [methods]):
-        m = m.strip().lower() if isinstance(m, str) else "other"
+    if not normalized:
+        methods = normalize_cooking_methods(methods)
+    for m in methods:
         idx = METHOD_TO_IDX.get(m, METHOD_TO_IDX["other"])
         vec[idx] = 1.0
     return vec
 
 
-def encode_portion(portion_class: str | None) -> np.ndarray:
+def encode_portion(portion_class: str | None, *, normalized: bool = False) -> np.ndarray:
     vec = np.zeros(len(PORTION_CLASSES), dtype=np.float32)
-    pc = (portion_class or "medium").strip().lower()
+    pc = portion_class if normalized else normalize_portion(portion_class)
     idx = PORTION_TO_IDX.get(pc, PORTION_TO_IDX["medium"])
     vec[idx] = 1.0
     return vec
@@ -38,19 +64,39 @@ def embed_dish(
     portion_class: str,
     ingredient_embeddings: dict[str, np.ndarray],
     mean_embedding: np.ndarray | None = None,
+    *,
+    ingredient_matrix: np.ndarray | None = None,
+    ingredient_key_to_idx: dict[str, int] | None = None,
+    normalized: bool = False,
 ) -> np.ndarray:
     """
     Build dish embedding = mean(ingredient_embeddings) + method_vec + sauce_scalar + portion_vec.
     Ingredients not in embedding dict use mean_embedding; if None, compute from ingredient_embeddings.
+    With ingredient_matrix and ingredient_key_to_idx (see loader.build_ingredient_matrix), known
+    ingredients are gathered from the matrix in one indexing op instead of per-item dict lookups.
+    A dish with no ingredients gets mean_embedding.
+    Pass normalized=True when ingredients, cooking_methods and portion_class already went
+    through the normalize_* helpers (as refine() does) to skip re-normalizing them.
     """
     if mean_embedding is None:
-        mean_embedding = np.mean(list(ingredient_embeddings.values()), axis=0)
-    ings = [str(x).strip().lower() for x in ingredients]
-    mean_ing = np.mean(
-        [ingredient_embeddings.get(ing, mean_embedding) for ing in ings],
-        axis=0,
-    )
-    method_vec = encode_cooking_methods(cooking_methods)
+        if ingredient_matrix is not None and len(ingredient_matrix):
+            mean_embedding = ingredient_matrix.mean(axis=0)
+        else:
+            mean_embedding = np.mean(list(ingredient_embeddings.values()), axis=0)
+    ings = ingredients if normalized else normalize_ingredients(ingredients)
+    if not ings:
+        mean_ing = mean_embedding
+    elif ingredient_matrix is not None and ingredient_key_to_idx is not None:
+        idxs = np.fromiter((ingredient_key_to_idx.get(ing, -1) for ing in ings), dtype=np.int64, count=len(ings))
+        known = idxs[idxs >= 0]
+        n_oov = len(ings) - len(known)
+        mean_ing = (ingredient_matrix[known].sum(axis=0) + mean_embedding * n_oov) / len(ings)
+    else:
+        mean_ing = np.mean(
+            [ingredient_embeddings.get(ing, mean_embedding) for ing in ings],
+            axis=0,
+        )
+    method_vec = encode_cooking_methods(cooking_methods, normalized=normalized)
     sauce_scalar = np.array([float(sauces)], dtype=np.float32)
-    portion_vec = encode_portion(portion_class)
+    portion_vec = encode_portion(portion_class, normalized=normalized)
     return np.concatenate([mean_ing, method_vec, sauce_scalar, portion_vec])
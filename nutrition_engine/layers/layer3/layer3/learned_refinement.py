@@ -4,71 +4,206 @@ Trained offline; used at inference when artifacts/refinement_model.joblib exists
 """
 from __future__ import annotations
 
+import logging
 from pathlib import Path
 from typing import Any
 
 import numpy as np
 
+logger = logging.getLogger(__name__)
+
 MACRO_KEYS = ["calories", "fat", "carbs", "protein", "sodium"]
 TOP_K_NEIGHBORS = 7
 QUERY_EMB_DIM = 26  # must match notebook dish embedding dim
 FEATURE_DIM = QUERY_EMB_DIM + 5 + TOP_K_NEIGHBORS * (QUERY_EMB_DIM + 5 + 1)  # 255
 
 
+def _fit_width(rows: np.ndarray, width: int) -> np.ndarray:
+    """Apply np.resize(row, width) to every row of a 2-D array (cyclic repeat or truncate)."""
+    n = rows.shape[1]
+    if n == width:
+        return rows
+    if n == 0:
+        return np.zeros((rows.shape[0], width), dtype=rows.dtype)
+    return rows[:, np.arange(width) % n]
+
+
+def build_feature_matrix(
+    query_embeddings: list[np.ndarray],
+    initial_macros_list: list[dict[str, float]],
+    similar_lists: list[list[dict[str, Any]]],
+    dish_embeddings: dict[str, dict],
+    dish_index: dict[str, Any] | None = None,
+) -> np.ndarray:
+    """
+    Build the (B, FEATURE_DIM) float32 feature matrix for B refine requests at once.
+    Row b has the build_feature_vector layout for (query_embeddings[b], initial_macros_list[b],
+    similar_lists[b]). With dish_index (loader.build_dish_index), all neighbor embeddings are
+    gathered from its matrix in one indexing op.
+    """
+    B = len(query_embeddings)
+    X = np.zeros((B, FEATURE_DIM), dtype=np.float32)
+    # Views into X for each block of the layout; rows are written in place
+    queries = X[:, :QUERY_EMB_DIM]
+    init = X[:, QUERY_EMB_DIM:QUERY_EMB_DIM + 5]
+    slots = X[:, QUERY_EMB_DIM + 5:].reshape(B, TOP_K_NEIGHBORS, QUERY_EMB_DIM + 6)
+    neb = slots[:, :, :QUERY_EMB_DIM]
+    nm = slots[:, :, QUERY_EMB_DIM:QUERY_EMB_DIM + 5]
+    sim = slots[:, :, QUERY_EMB_DIM + 5]
+    # Row of each neighbor in dish_index["matrix"], -1 where absent
+    rows = np.full((B, TOP_K_NEIGHBORS), -1, dtype=np.int64)
+    id_to_idx = dish_index["id_to_idx"] if dish_index is not None else dish_embeddings
+
+    for b, (query_embedding, initial_macros, similar_dishes) in enumerate(
+        zip(query_embeddings, initial_macros_list, similar_lists)
+    ):
+        q = np.asarray(query_embedding).ravel()
+        queries[b] = q if q.size == QUERY_EMB_DIM else np.resize(q, QUERY_EMB_DIM)
+        init[b] = [float(initial_macros.get(k, 0)) for k in MACRO_KEYS]
+        for i, d in enumerate(similar_dishes[:TOP_K_NEIGHBORS]):
+            did = d.get("dish_id")
+            if not did or did not in id_to_idx:
+                continue  # zero-padded like a missing neighbor
+            if dish_index is not None:
+                rows[b, i] = id_to_idx[did]
+            else:
+                e = np.asarray(dish_embeddings[did]["embedding"]).ravel()
+                neb[b, i] = e if e.size == QUERY_EMB_DIM else np.resize(e, QUERY_EMB_DIM)
+            macros = d.get("macros", {})
+            nm[b, i] = [float(macros.get(k, 0)) for k in MACRO_KEYS]
+            sim[b, i] = float(d.get("similarity", 0))
+
+    if dish_index is not None:
+        found = rows >= 0
+        if found.any():
+            neb[found] = _fit_width(dish_index["matrix"][rows[found]], QUERY_EMB_DIM)
+
+    return X
+
+
 def build_feature_vector(
     query_embedding: np.ndarray,
     initial_macros: dict[str, float],
     similar_dishes: list[dict[str, Any]],
     dish_embeddings: dict[str, dict],
+    dish_index: dict[str, Any] | None = None,
 ) -> np.ndarray:
     """
     Build fixed-size feature vector for the refinement model.
     Layout: query_emb (26) + initial_macros (5) + [neighbor_emb (26) + neighbor_macros (5) + sim (1)] * 7.
     Pads with zeros if fewer than 7 neighbors; truncates if more.
+    With dish_index (loader.build_dish_index), neighbor embeddings are read from its matrix.
     """
-    q = np.asarray(query_embedding, dtype=np.float64).ravel()
-    if q.size != QUERY_EMB_DIM:
-        q = np.resize(q, QUERY_EMB_DIM)
-    init = np.array(
-        [float(initial_macros.get(k, 0)) for k in MACRO_KEYS],
-        dtype=np.float64,
-    )
-    parts = [q, init]
-    for i in range(TOP_K_NEIGHBORS):
-        if i < len(similar_dishes):
-            d = similar_dishes[i]
-            did = d.get("dish_id")
-            if did and did in dish_embeddings:
-                neb = np.asarray(dish_embeddings[did]["embedding"], dtype=np.float64).ravel()
-                neb = np.resize(neb, QUERY_EMB_DIM)
-                nm = np.array(
-                    [float(d.get("macros", {}).get(k, 0)) for k in MACRO_KEYS],
-                    dtype=np.float64,
-                )
-                sim = float(d.get("similarity", 0))
-            else:
-                neb = np.zeros(QUERY_EMB_DIM, dtype=np.float64)
-                nm = np.zeros(5, dtype=np.float64)
-                sim = 0.0
-        else:
-            neb = np.zeros(QUERY_EMB_DIM, dtype=np.float64)
-            nm = np.zeros(5, dtype=np.float64)
-            sim = 0.0
-        parts.append(neb)
-        parts.append(nm)
-        parts.append(np.array([sim], dtype=np.float64))
-    out = np.concatenate(parts).astype(np.float64)
-    if out.size != FEATURE_DIM:
-        out = np.resize(out, FEATURE_DIM)
-    return out
+    return build_feature_matrix(
+        [query_embedding], [initial_macros], [similar_dishes], dish_embeddings, dish_index
+    )[0]
+
+
+class _OnnxModel:
+    """sklearn-style predict() over an onnxruntime session (scaler fused into the graph)."""
+
+    def __init__(self, session: Any):
+        self._session = session
+        self._input_name = session.get_inputs()[0].name
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self._session.run(None, {self._input_name: np.asarray(X, dtype=np.float32)})[0]
+
+
+class _AffineModel:
+    """sklearn-style predict() as one X @ W.T + b, for a linear model with its scaler folded in."""
+
+    def __init__(self, weights: np.ndarray, bias: np.ndarray):
+        self._weights_t = np.ascontiguousarray(weights.T)
+        self._bias = bias
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return X @ self._weights_t + self._bias
+
+
+def _fold_linear(model: Any, scaler_X: Any) -> tuple[Any, Any]:
+    """
+    (_AffineModel, None) when model is linear (coef_, intercept_) and scaler_X is None or
+    standard-scaler shaped (mean_, scale_), checked against model.predict on probe rows;
+    otherwise (model, scaler_X) unchanged. Skips sklearn's per-call input validation,
+    which dominates the cost of predicting a single row.
+    """
+    coef = getattr(model, "coef_", None)
+    intercept = getattr(model, "intercept_", None)
+    if coef is None or intercept is None:
+        return (model, scaler_X)
+    try:
+        weights = np.asarray(coef, dtype=np.float64)
+        bias = np.asarray(intercept, dtype=np.float64)
+        width = weights.shape[-1]
+        if scaler_X is not None:
+            mean = getattr(scaler_X, "mean_", None)
+            scale = getattr(scaler_X, "scale_", None)
+            mean = np.zeros(width) if mean is None else np.asarray(mean, dtype=np.float64)
+            scale = np.ones(width) if scale is None else np.asarray(scale, dtype=np.float64)
+            # ((x - mean) / scale) @ W.T + b  ==  x @ (W / scale).T + (b - (mean / scale) @ W.T)
+            weights = weights / scale
+            bias = bias - mean @ weights.T
+        folded = _AffineModel(weights, bias)
+
+        probe = np.random.default_rng(0).normal(size=(8, width))
+        expected = np.asarray(model.predict(scaler_X.transform(probe) if scaler_X is not None else probe))
+        got = folded.predict(probe)
+        atol = 1e-9 * (1 + np.abs(expected).max())
+        if got.shape == expected.shape and np.allclose(got, expected, rtol=1e-9, atol=atol):
+            return (folded, None)
+    except Exception:
+        pass
+    return (model, scaler_X)
+
+
+def _load_onnx(path: Path) -> tuple[Any, Any] | None:
+    """(model, None) from an ONNX export, or None if missing or onnxruntime is unavailable."""
+    if not path.is_file():
+        return None
+    try:
+        import onnxruntime as ort
+        session = ort.InferenceSession(str(path), providers=["CPUExecutionProvider"])
+        return (_OnnxModel(session), None)
+    except Exception:
+        return None
+
+
+def _onnx_is_current(onnx_path: Path, joblib_path: Path) -> bool:
+    """
+    True when the ONNX export exists and the joblib model was not modified after it.
+    Logs a warning for a stale export (joblib model retrained without rerunning export_onnx).
+    """
+    if not onnx_path.is_file():
+        return False
+    if joblib_path.is_file() and joblib_path.stat().st_mtime_ns > onnx_path.stat().st_mtime_ns:
+        logger.warning(
+            "Layer 3: %s is newer than %s; loading it instead (rerun convert_artifacts --onnx)",
+            joblib_path.name, onnx_path.name,
+        )
+        return False
+    return True
 
 
 def load_model(artifacts_dir: Path) -> tuple[Any, Any] | None:
     """
     Load refinement model and scaler from artifacts_dir.
     Returns (model, scaler_X) or None if not present.
+    Prefers refinement_model.onnx (see export_onnx) when onnxruntime is installed and the export
+    is at least as new as refinement_model.joblib.
+    A linear joblib model is folded with its scaler into one affine map (see _fold_linear).
     """
-    path = artifacts_dir / "refinement_model.joblib"
+    onnx_path = artifacts_dir / "refinement_model.onnx"
+    if _onnx_is_current(onnx_path, artifacts_dir / "refinement_model.joblib"):
+        onnx = _load_onnx(onnx_path)
+        if onnx is not None:
+            return onnx
+    loaded = _load_joblib(artifacts_dir / "refinement_model.joblib")
+    return _fold_linear(*loaded) if loaded is not None else None
+
+
+def _load_joblib(path: Path) -> tuple[Any, Any] | None:
+    """(model, scaler_X) from the joblib artifact, or None if missing or unreadable."""
     if not path.is_file():
         return None
     try:
@@ -81,6 +216,91 @@ def load_model(artifacts_dir: Path) -> tuple[Any, Any] | None:
         return None
 
 
+def export_onnx(artifacts_dir: Path) -> Path:
+    """
+    Convert refinement_model.joblib into refinement_model.onnx (requires skl2onnx).
+    The scaler, if any, becomes the first op of the graph; inputs are float32 (1, FEATURE_DIM) rows.
+    """
+    from skl2onnx import to_onnx
+    from sklearn.pipeline import make_pipeline
+
+    loaded = _load_joblib(artifacts_dir / "refinement_model.joblib")
+    if loaded is None:
+        raise FileNotFoundError(f"No refinement_model.joblib in {artifacts_dir}")
+    model, scaler_X = loaded
+    estimator = make_pipeline(scaler_X, model) if scaler_X is not None else model
+    onx = to_onnx(estimator, np.zeros((1, FEATURE_DIM), dtype=np.float32))
+    out = artifacts_dir / "refinement_model.onnx"
+    out.write_bytes(onx.SerializeToString())
+    return out
+
+
+def _delta_bounds(macro_delta_stats: dict[str, dict]) -> list[tuple[str, float, float]]:
+    """(key, 1 + p10, 1 + p90) per macro, looked up once per batch instead of once per row."""
+    bounds = []
+    for key in MACRO_KEYS:
+        stats = macro_delta_stats.get(key, {})
+        bounds.append((key, 1 + stats.get("p10", -1.0), 1 + stats.get("p90", 1.0)))
+    return bounds
+
+
+def _clamp_to_bounds(
+    refined: dict[str, float],
+    initial_macros: dict[str, float],
+    bounds: list[tuple[str, float, float]],
+) -> dict[str, float]:
+    """Clamp each macro to initial * (1 + p10) .. initial * (1 + p90); bounds from _delta_bounds."""
+    for key, low_factor, high_factor in bounds:
+        base = initial_macros.get(key, 0) or 1e-9
+        value = refined[key]
+        # max(low, min(high, value)) as plain comparisons
+        high = base * high_factor
+        if not value < high:
+            value = high
+        low = base * low_factor
+        if not value > low:
+            value = low
+        refined[key] = value
+    return refined
+
+
+def predict_batch(
+    query_embeddings: list[np.ndarray],
+    initial_macros_list: list[dict[str, float]],
+    similar_lists: list[list[dict[str, Any]]],
+    dish_embeddings: dict[str, dict],
+    model_and_scaler: tuple[Any, Any],
+    macro_delta_stats: dict[str, dict] | None = None,
+    clamp_to_bounds: bool = True,
+    dish_index: dict[str, Any] | None = None,
+) -> list[dict[str, float]]:
+    """
+    Predict refined macros for B requests with one scaler.transform and one model.predict.
+    Same per-row results (and clamping) as predict().
+    """
+    if not query_embeddings:
+        return []
+    model, scaler_X = model_and_scaler
+    X = build_feature_matrix(
+        query_embeddings,
+        initial_macros_list,
+        similar_lists,
+        dish_embeddings,
+        dish_index=dish_index,
+    )
+    if scaler_X is not None:
+        X = scaler_X.transform(X)
+    pred = np.asarray(model.predict(X)).reshape(len(query_embeddings), -1).tolist()
+    bounds = _delta_bounds(macro_delta_stats) if clamp_to_bounds and macro_delta_stats else None
+    results = []
+    for row, initial_macros in zip(pred, initial_macros_list):
+        refined = {k: row[i] for i, k in enumerate(MACRO_KEYS)}
+        if bounds is not None and initial_macros:
+            refined = _clamp_to_bounds(refined, initial_macros, bounds)
+        results.append(refined)
+    return results
+
+
 def predict(
     query_embedding: np.ndarray,
     initial_macros: dict[str, float],
@@ -89,32 +309,20 @@ def predict(
     model_and_scaler: tuple[Any, Any],
     macro_delta_stats: dict[str, dict] | None = None,
     clamp_to_bounds: bool = True,
+    dish_index: dict[str, Any] | None = None,
 ) -> dict[str, float]:
     """
     Predict refined macros using the learned model.
     If clamp_to_bounds and macro_delta_stats provided, clamp each macro to
     initial * (1 + p10) .. initial * (1 + p90).
     """
-    model, scaler_X = model_and_scaler
-    X = build_feature_vector(
-        query_embedding,
-        initial_macros,
-        similar_dishes,
+    return predict_batch(
+        [query_embedding],
+        [initial_macros],
+        [similar_dishes],
         dish_embeddings,
-    )
-    X = X.reshape(1, -1)
-    if scaler_X is not None:
-        X = scaler_X.transform(X)
-    pred = model.predict(X)
-    pred = np.asarray(pred).ravel()
-    refined = {k: float(pred[i]) for i, k in enumerate(MACRO_KEYS)}
-    if clamp_to_bounds and macro_delta_stats and initial_macros:
-        for key in MACRO_KEYS:
-            base = initial_macros.get(key, 0) or 1e-9
-            stats = macro_delta_stats.get(key, {})
-            p10 = stats.get("p10", -1.0)
-            p90 = stats.get("p90", 1.0)
-            low = base * (1 + p10)
-            high = base * (1 + p90)
-            refined[key] = max(low, min(high, refined[key]))
-    return refined
+        model_and_scaler,
+        macro_delta_stats=macro_delta_stats,
+        clamp_to_bounds=clamp_to_bounds,
+        dish_index=dish_index,
+    )[0]
@@ -1,12 +1,24 @@
 """
 Load Layer 3 artifacts (read-only). Artifacts are built by layer3_artifact_build.ipynb.
+
+The three pickles can be converted once (see convert_artifacts.py) into plain .npy arrays under
+ARRAYS_DIRNAME; when present and at least as new as the pickles, load_all memory-maps those
+instead of unpickling.
 """
+from collections.abc import Mapping
+from functools import lru_cache
 from pathlib import Path
 from typing import Any
 
 import json
+import logging
 import pickle
 
+import numpy as np
+
+from .learned_refinement import load_model as load_learned_model
+
+logger = logging.getLogger(__name__)
 
 DEFAULT_ARTIFACTS_DIR = Path(__file__).resolve().parent.parent / "artifacts"
 
@@ -14,6 +26,20 @@ COOKING_METHODS_ORDER = [
     "raw", "steamed", "boiled", "baked", "grilled", "fried", "sauteed", "roasted", "other"
 ]
 PORTION_CLASSES = ["small", "medium", "large"]
+MACRO_KEYS = ["calories", "fat", "carbs", "protein", "sodium"]
+
+# Subdirectory of artifacts_dir holding the .npy form of the pickled artifacts
+ARRAYS_DIRNAME = "arrays"
+ARRAY_NAMES = (
+    "ing_keys", "ing_emb", "dish_ids", "dish_emb", "dish_macros",
+    "neighbor_query_ids", "neighbor_ids", "neighbor_sims", "neighbor_deltas",
+)
+# Optional extras: the cosine-normalized dish matrix, so workers map it instead of recomputing it
+OPTIONAL_ARRAY_NAMES = ("dish_unit",)
+# Pickled artifacts export_arrays reads; arrays older than any of them are stale
+ARRAY_SOURCES = ("ingredient_embeddings.pkl", "dish_embeddings.pkl", "neighbor_index.pkl")
+# Neighbor lists a NeighborIndex keeps built for repeat lookups of the same dish_id
+NEIGHBOR_CACHE_SIZE = 4096
 
 
 def load_ingredient_embeddings(artifacts_dir: Path = DEFAULT_ARTIFACTS_DIR) -> dict[str, Any]:
@@ -41,12 +67,276 @@ def load_confidence_params(artifacts_dir: Path = DEFAULT_ARTIFACTS_DIR) -> dict[
         return json.load(f)
 
 
+def _ingredient_entries(keys: list[str], mat: np.ndarray) -> dict[str, Any]:
+    """Derived ingredient artifacts for keys and their (N, D) float32 rows in mat."""
+    return {
+        "ingredient_embeddings_matrix": mat,
+        "ingredient_keys": keys,
+        "ingredient_key_to_idx": {k: i for i, k in enumerate(keys)},
+        "ingredient_embeddings_mean": mat.mean(axis=0) if keys else None,
+        "known_ingredients_normalized": frozenset(str(k).strip().lower() for k in keys),
+    }
+
+
+def build_ingredient_matrix(ingredient_embeddings: dict[str, Any]) -> dict[str, Any]:
+    """
+    Stack ingredient embeddings into a contiguous (N, D) float32 matrix, once at load time.
+    Keys: ingredient_embeddings_matrix, ingredient_keys, ingredient_key_to_idx,
+    ingredient_embeddings_mean (None when there are no embeddings) and
+    known_ingredients_normalized (stripped, lowercased keys for coverage checks).
+    """
+    keys = list(ingredient_embeddings.keys())
+    if not keys:
+        return _ingredient_entries(keys, np.empty((0, 0), dtype=np.float32))
+    mat = np.ascontiguousarray(np.stack([ingredient_embeddings[k] for k in keys]), dtype=np.float32)
+    return _ingredient_entries(keys, mat)
+
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    """matrix rows scaled to unit length (float32); all-zero rows stay zero."""
+    norms = np.linalg.norm(matrix.astype(np.float64), axis=1)
+    scale = np.where(norms < 1e-12, 0.0, 1.0 / np.where(norms < 1e-12, 1.0, norms))
+    return (matrix * scale[:, None]).astype(np.float32)
+
+
+def _dish_index(ids: list[str], matrix: np.ndarray, unit: np.ndarray | None = None) -> dict[str, Any]:
+    """dish_index for ids and their (M, D) float32 embedding rows in matrix (unit computed if not given)."""
+    if not ids:
+        empty = np.empty((0, 0), dtype=np.float32)
+        return {"ids": ids, "id_to_idx": {}, "matrix": empty, "unit": empty}
+    return {
+        "ids": ids,
+        "id_to_idx": {d: i for i, d in enumerate(ids)},
+        "matrix": matrix,
+        "unit": unit if unit is not None else _unit_rows(matrix),
+    }
+
+
+def build_dish_index(dish_embeddings: dict[str, dict]) -> dict[str, Any]:
+    """
+    Column-wise view of dish_embeddings for vectorized similarity search.
+    Keys: ids (list, dict order), id_to_idx, matrix ((M, D) float32 embeddings) and
+    unit (matrix rows scaled to unit length; all-zero rows stay zero).
+    """
+    ids = list(dish_embeddings.keys())
+    if not ids:
+        return _dish_index(ids, np.empty((0, 0), dtype=np.float32))
+    matrix = np.ascontiguousarray(
+        np.stack([np.asarray(dish_embeddings[i]["embedding"]).ravel() for i in ids]), dtype=np.float32
+    )
+    return _dish_index(ids, matrix)
+
+
+def _share_matrix_rows(
+    embeddings: dict[str, Any], keys: list[str], matrix: np.ndarray, field: str | None = None
+) -> None:
+    """
+    Replace each embedding in a freshly unpickled dict with a view of its float32 row in matrix,
+    so every vector is held once instead of once in the dict and once in the stacked matrix.
+    """
+    for i, k in enumerate(keys):
+        if field is None:
+            embeddings[k] = matrix[i]
+        else:
+            embeddings[k][field] = matrix[i]
+
+
+def _macro_rows(dicts: list[dict]) -> np.ndarray:
+    """(len(dicts), 5) float64 in MACRO_KEYS order; NaN marks a missing key."""
+    return np.array(
+        [[d.get(k, np.nan) for k in MACRO_KEYS] for d in dicts], dtype=np.float64
+    ).reshape(len(dicts), len(MACRO_KEYS))
+
+
+def _macro_dict(row: list[float]) -> dict[str, float]:
+    return {k: v for k, v in zip(MACRO_KEYS, row) if v == v}
+
+
+class NeighborIndex(Mapping):
+    """
+    Read-only dish_id -> neighbor list view over the padded neighbor arrays from export_arrays.
+    Behaves like the neighbor_index.pkl dict with ids as str, but each list is built from its array
+    row on first lookup, so loading creates no per-neighbor objects. The last NEIGHBOR_CACHE_SIZE
+    lists looked up are kept and returned as-is on repeat lookups, the same shared lists the
+    pickled dict hands out.
+    """
+
+    def __init__(self, query_ids: list[str], neighbor_ids: np.ndarray, sims: np.ndarray, deltas: np.ndarray):
+        self._rows = {q: i for i, q in enumerate(query_ids)}
+        self._neighbor_ids = neighbor_ids
+        self._sims = sims
+        self._deltas = deltas
+        self._lookup = lru_cache(maxsize=NEIGHBOR_CACHE_SIZE)(self._build)
+
+    def _build(self, dish_id: str) -> list[dict[str, Any]]:
+        q = self._rows[dish_id]
+        return [
+            {"neighbor_id": nid, "similarity": sim, "macro_deltas": _macro_dict(deltas)}
+            for nid, sim, deltas in zip(
+                self._neighbor_ids[q].tolist(), self._sims[q].tolist(), self._deltas[q].tolist()
+            )
+            if nid
+        ]
+
+    def __getitem__(self, dish_id: str) -> list[dict[str, Any]]:
+        return self._lookup(dish_id)
+
+    def __contains__(self, dish_id: object) -> bool:
+        return dish_id in self._rows
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+def export_arrays(artifacts_dir: Path = DEFAULT_ARTIFACTS_DIR) -> Path:
+    """
+    Convert the three pickled artifacts into .npy arrays under artifacts_dir / ARRAYS_DIRNAME.
+    Ids become fixed-width unicode arrays, so the files load with allow_pickle=False; every id
+    (ingredient key, dish id, neighbor id) therefore loads back as str(id), whatever its type in
+    the pickles. Neighbor lists are padded to the longest list (empty id, zero similarity, NaN
+    deltas), so a neighbor id that is empty as a string raises ValueError rather than being read
+    back as padding. Only MACRO_KEYS are kept from the macro dicts. Returns the arrays directory.
+    """
+    ing = load_ingredient_embeddings(artifacts_dir)
+    dishes = load_dish_embeddings(artifacts_dir)
+    neighbors = load_neighbor_index(artifacts_dir)
+    ing_keys = list(ing.keys())
+    dish_ids = list(dishes.keys())
+    query_ids = list(neighbors.keys())
+    dish_index = build_dish_index(dishes)
+    k = max((len(v) for v in neighbors.values()), default=0)
+    neighbor_ids = np.full((len(query_ids), k), "", dtype=object)
+    neighbor_sims = np.zeros((len(query_ids), k), dtype=np.float64)
+    neighbor_deltas = np.full((len(query_ids), k, len(MACRO_KEYS)), np.nan, dtype=np.float64)
+    for q, qid in enumerate(query_ids):
+        for j, n in enumerate(neighbors[qid]):
+            nid = str(n["neighbor_id"])
+            if not nid:
+                raise ValueError(f"neighbor_index[{qid!r}][{j}] has an empty neighbor_id (reserved for padding)")
+            neighbor_ids[q, j] = nid
+            neighbor_sims[q, j] = n["similarity"]
+            neighbor_deltas[q, j] = _macro_rows([n["macro_deltas"]])[0]
+    arrays = {
+        "ing_keys": np.array([str(x) for x in ing_keys], dtype=str),
+        "ing_emb": build_ingredient_matrix(ing)["ingredient_embeddings_matrix"],
+        "dish_ids": np.array([str(x) for x in dish_ids], dtype=str),
+        "dish_emb": dish_index["matrix"],
+        "dish_unit": dish_index["unit"],
+        "dish_macros": _macro_rows([dishes[d]["macros"] for d in dish_ids]),
+        "neighbor_query_ids": np.array([str(x) for x in query_ids], dtype=str),
+        "neighbor_ids": neighbor_ids.astype(str),
+        "neighbor_sims": neighbor_sims,
+        "neighbor_deltas": neighbor_deltas,
+    }
+    out = artifacts_dir / ARRAYS_DIRNAME
+    out.mkdir(exist_ok=True)
+    for name in ARRAY_NAMES + OPTIONAL_ARRAY_NAMES:
+        np.save(out / f"{name}.npy", arrays[name], allow_pickle=False)
+    return out
+
+
+def _load_npy(path: Path) -> np.ndarray:
+    """
+    Read-only memory-mapped .npy as a plain ndarray view. Indexing and arithmetic on np.memmap
+    wrap every result in the subclass, which costs about a microsecond per row lookup.
+    """
+    return np.asarray(np.load(path, mmap_mode="r", allow_pickle=False))
+
+
+def load_arrays(artifacts_dir: Path = DEFAULT_ARTIFACTS_DIR) -> dict[str, Any]:
+    """
+    Load the export_arrays output. Embedding matrices are memory-mapped read-only (pages are shared
+    across worker processes); the dict-shaped artifacts are rebuilt with rows as views into them,
+    and neighbor_index is a NeighborIndex over the neighbor arrays.
+    Returns the same keys load_all produces for the embeddings and neighbor index.
+    """
+    base = artifacts_dir / ARRAYS_DIRNAME
+    a = {name: _load_npy(base / f"{name}.npy") for name in ARRAY_NAMES}
+    for name in OPTIONAL_ARRAY_NAMES:
+        if (base / f"{name}.npy").is_file():
+            a[name] = _load_npy(base / f"{name}.npy")
+    ing_keys = a["ing_keys"].tolist()
+    ing_emb = a["ing_emb"]
+    dish_ids = a["dish_ids"].tolist()
+    dish_emb = a["dish_emb"]
+    dish_macros = a["dish_macros"].tolist()
+    neighbor_index = NeighborIndex(
+        a["neighbor_query_ids"].tolist(), a["neighbor_ids"], a["neighbor_sims"], a["neighbor_deltas"]
+    )
+    return {
+        "ingredient_embeddings": {k: ing_emb[i] for i, k in enumerate(ing_keys)},
+        **_ingredient_entries(ing_keys, ing_emb),
+        "dish_embeddings": {
+            d: {"embedding": dish_emb[i], "macros": _macro_dict(dish_macros[i])}
+            for i, d in enumerate(dish_ids)
+        },
+        "dish_index": _dish_index(dish_ids, dish_emb, a.get("dish_unit")),
+        "neighbor_index": neighbor_index,
+    }
+
+
+def _arrays_are_current(artifacts_dir: Path = DEFAULT_ARTIFACTS_DIR) -> bool:
+    """
+    True when the export_arrays output exists and none of ARRAY_SOURCES was modified after it
+    (pickles that are absent do not count). Logs a warning when the arrays are incomplete or stale,
+    e.g. after the artifacts were rebuilt without rerunning convert_artifacts.
+    """
+    base = artifacts_dir / ARRAYS_DIRNAME
+    if not (base / "dish_emb.npy").is_file():
+        return False
+    try:
+        exported = min((base / f"{name}.npy").stat().st_mtime_ns for name in ARRAY_NAMES)
+    except FileNotFoundError as e:
+        logger.warning("Layer 3: incomplete arrays in %s (%s); loading the pickles", base, e.filename)
+        return False
+    stale = [
+        name for name in ARRAY_SOURCES
+        if (artifacts_dir / name).is_file() and (artifacts_dir / name).stat().st_mtime_ns > exported
+    ]
+    if stale:
+        logger.warning(
+            "Layer 3: %s newer than the arrays in %s; loading the pickles (rerun convert_artifacts)",
+            ", ".join(stale), base,
+        )
+        return False
+    return True
+
+
 def load_all(artifacts_dir: Path = DEFAULT_ARTIFACTS_DIR) -> dict[str, Any]:
-    """Load all artifacts. Keys: ingredient_embeddings, dish_embeddings, neighbor_index, macro_delta_stats, confidence_params."""
+    """
+    Load all artifacts. Keys: ingredient_embeddings, dish_embeddings, neighbor_index, macro_delta_stats,
+    confidence_params, plus the derived ingredient matrix keys from build_ingredient_matrix and
+    dish_index from build_dish_index, and learned_model (learned_refinement.load_model, None if absent).
+    Uses the memory-mapped arrays from export_arrays when present and current (_arrays_are_current).
+    """
+    if _arrays_are_current(artifacts_dir):
+        return {
+            **load_arrays(artifacts_dir),
+            "macro_delta_stats": load_macro_delta_stats(artifacts_dir),
+            "confidence_params": load_confidence_params(artifacts_dir),
+            "learned_model": load_learned_model(artifacts_dir),
+        }
+    ingredient_embeddings = load_ingredient_embeddings(artifacts_dir)
+    dish_embeddings = load_dish_embeddings(artifacts_dir)
+    ingredient_entries = build_ingredient_matrix(ingredient_embeddings)
+    dish_index = build_dish_index(dish_embeddings)
+    # Embeddings are kept as float32 only: the dict entries become rows of the stacked matrices
+    _share_matrix_rows(
+        ingredient_embeddings,
+        ingredient_entries["ingredient_keys"],
+        ingredient_entries["ingredient_embeddings_matrix"],
+    )
+    _share_matrix_rows(dish_embeddings, dish_index["ids"], dish_index["matrix"], "embedding")
     return {
-        "ingredient_embeddings": load_ingredient_embeddings(artifacts_dir),
-        "dish_embeddings": load_dish_embeddings(artifacts_dir),
+        "ingredient_embeddings": ingredient_embeddings,
+        **ingredient_entries,
+        "dish_embeddings": dish_embeddings,
+        "dish_index": dish_index,
         "neighbor_index": load_neighbor_index(artifacts_dir),
         "macro_delta_stats": load_macro_delta_stats(artifacts_dir),
         "confidence_params": load_confidence_params(artifacts_dir),
+        "learned_model": load_learned_model(artifacts_dir),
     }
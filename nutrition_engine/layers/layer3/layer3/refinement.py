@@ -8,6 +8,8 @@ from typing import Any
 
 MACRO_KEYS = ["calories", "fat", "carbs", "protein", "sodium"]
 
+_MISSING = object()
+
 
 def clamp_delta(delta: float, stats: dict[str, float]) -> float:
     """Clamp a relative delta to [p10, p90] from macro_delta_stats."""
@@ -29,6 +31,14 @@ def refine_macros(
     (neighbor_macro - initial) / initial, weighted by similarity; delta is clamped to p10–p90.
     If use_median_delta: use macro_delta_stats median only (no neighbors). Else use neighbors.
     """
+    # (weight, macros dict) per neighbor, resolved once for all macros
+    neighbors = []
+    for n in similar_dishes:
+        neighbor_macros = n.get("macros", n)
+        if isinstance(neighbor_macros, dict):
+            w = n.get("similarity", 0.5) if weight_by_similarity else 1.0
+            neighbors.append((w, neighbor_macros))
+
     refined = {}
     for key in MACRO_KEYS:
         if key not in initial_macros:
@@ -48,18 +58,21 @@ def refine_macros(
             refined[key] = base
             continue
 
+        # clamp_delta inlined: bounds looked up once per macro, not per neighbor
+        p10 = stats.get("p10", -1.0)
+        p90 = stats.get("p90", 1.0)
         weighted_delta_sum = 0.0
         weight_sum = 0.0
-        for n in similar_dishes:
-            sim = n.get("similarity", 0.5)
-            neighbor_macros = n.get("macros", n)
-            if isinstance(neighbor_macros, dict) and key in neighbor_macros:
-                mj = neighbor_macros[key]
-            else:
+        for w, neighbor_macros in neighbors:
+            mj = neighbor_macros.get(key, _MISSING)
+            if mj is _MISSING:
                 continue
             delta = (mj - base) / denom
-            delta = clamp_delta(delta, stats)
-            w = sim if weight_by_similarity else 1.0
+            # max(p10, min(p90, delta)) as plain comparisons (NaN lands on the bound the same way)
+            if not delta < p90:
+                delta = p90
+            if not delta > p10:
+                delta = p10
             weighted_delta_sum += w * delta
             weight_sum += w
         if weight_sum < 1e-12:
@@ -82,25 +95,35 @@ def refine_macros_from_deltas(
     Refine using neighbor_list items that have "macro_deltas" and "similarity"
     (e.g. from neighbor_index for a known dish). Clamp each delta to p10–p90.
     """
+    # (weight, deltas dict) per neighbor, resolved once for all macros
+    neighbors = [
+        (n.get("similarity", 0.5) if weight_by_similarity else 1.0, n.get("macro_deltas", {}))
+        for n in neighbor_list
+    ]
+
     refined = {}
     for key in MACRO_KEYS:
         base = initial_macros.get(key, 0.0)
-        denom = base if abs(base) > 1e-9 else 1.0
         stats = macro_delta_stats.get(key, {})
 
         if not neighbor_list:
             refined[key] = base
             continue
 
+        # clamp_delta inlined: bounds looked up once per macro, not per neighbor
+        p10 = stats.get("p10", -1.0)
+        p90 = stats.get("p90", 1.0)
         weighted_delta_sum = 0.0
         weight_sum = 0.0
-        for n in neighbor_list:
-            sim = n.get("similarity", 0.5)
-            deltas = n.get("macro_deltas", {})
-            if key not in deltas:
+        for w, deltas in neighbors:
+            delta = deltas.get(key, _MISSING)
+            if delta is _MISSING:
                 continue
-            delta = clamp_delta(deltas[key], stats)
-            w = sim if weight_by_similarity else 1.0
+            # max(p10, min(p90, delta)) as plain comparisons
+            if not delta < p90:
+                delta = p90
+            if not delta > p10:
+                delta = p10
             weighted_delta_sum += w * delta
             weight_sum += w
         if weight_sum < 1e-12:
@@ -3,38 +3,199 @@ Find similar dishes by cosine similarity. Uses dish_embeddings; for known dish_i
 """
 from __future__ import annotations
 
+import math
+import operator
+import threading
+from collections import OrderedDict
 from typing import Any
 
 import numpy as np
 
+from .loader import build_dish_index
 
-def cosine_sim(a: np.ndarray, b: np.ndarray) -> float:
-    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
-    na = np.linalg.norm(a)
-    nb = np.linalg.norm(b)
+try:
+    import simsimd as _simsimd  # optional SIMD kernels for float32 cosine_sim
+except ImportError:
+    _simsimd = None
+
+
+# (dish_embeddings, its keys, its embedding objects, dish_index) for the last dict indexed on the fly.
+# Holding the dict and its embeddings keeps their ids from being reused by other objects.
+_dish_index_cache: tuple[dict, list, list, dict] | None = None
+_dish_index_lock = threading.Lock()
+
+
+def _cached_dish_index(dish_embeddings: dict[str, dict]) -> dict[str, Any]:
+    """
+    build_dish_index(dish_embeddings), reused while the same dict is passed again with the same
+    keys in the same order, each mapped to the same embedding object. Writes into an embedding
+    array in place are not detected; callers that make them should pass their own dish_index.
+    """
+    global _dish_index_cache
+    keys = list(dish_embeddings)
+    embeddings = [d["embedding"] for d in dish_embeddings.values()]
+    with _dish_index_lock:
+        cached = _dish_index_cache
+        if (
+            cached is not None
+            and cached[0] is dish_embeddings
+            and cached[1] == keys
+            and all(map(operator.is_, cached[2], embeddings))
+        ):
+            return cached[3]
+        dish_index = build_dish_index(dish_embeddings)
+        _dish_index_cache = (dish_embeddings, keys, embeddings, dish_index)
+        return dish_index
+
+
+# Top-k results for recent queries against one dish_index: (dish_index, OrderedDict) with
+# (query float64 bytes, k) -> ((dish_id, similarity), ...), least recently used first.
+# Entries keep only ids and scores; macros are read from dish_embeddings on every call.
+TOPK_CACHE_SIZE = 1024
+_topk_cache: tuple[dict, OrderedDict] | None = None
+_topk_cache_lock = threading.Lock()
+
+
+def _topk_cache_get(dish_index: dict[str, Any], key: tuple[bytes, int]) -> tuple | None:
+    with _topk_cache_lock:
+        cached = _topk_cache
+        if cached is None or cached[0] is not dish_index:
+            return None
+        hit = cached[1].get(key)
+        if hit is not None:
+            cached[1].move_to_end(key)
+        return hit
+
+
+def _topk_cache_put(dish_index: dict[str, Any], key: tuple[bytes, int], value: tuple) -> None:
+    global _topk_cache
+    with _topk_cache_lock:
+        if _topk_cache is None or _topk_cache[0] is not dish_index:
+            # A different index (reloaded or rebuilt artifacts) drops every cached result
+            _topk_cache = (dish_index, OrderedDict())
+        entries = _topk_cache[1]
+        entries[key] = value
+        if len(entries) > TOPK_CACHE_SIZE:
+            entries.popitem(last=False)
+
+
+def _as_float64(x: Any) -> np.ndarray:
+    return x if isinstance(x, np.ndarray) and x.dtype == np.float64 else np.asarray(x, dtype=np.float64)
+
+
+def _is_float32_vector(x: Any) -> bool:
+    return isinstance(x, np.ndarray) and x.dtype == np.float32 and x.ndim == 1 and x.flags.c_contiguous
+
+
+def cosine_sim(a: np.ndarray, b: np.ndarray, *, presumed_normalized: bool = False) -> float:
+    """
+    Cosine similarity; 0.0 when either vector has (near-)zero norm.
+    With simsimd installed, 1-D float32 vectors go through its SIMD kernel (float32 rounding).
+    presumed_normalized=True skips both norms for vectors already scaled to unit length
+    (e.g. rows of dish_index["unit"]), leaving a plain dot product.
+    """
+    if presumed_normalized:
+        return float(np.dot(a, b))
+    if _simsimd is not None and _is_float32_vector(a) and _is_float32_vector(b) and len(a) == len(b):
+        distance = float(_simsimd.cosine(a, b))
+        # SimSIMD scores two zero vectors as identical (distance 0); here they score 0
+        if distance == 0.0 and not a.any():
+            return 0.0
+        return 1.0 - distance
+    a, b = _as_float64(a), _as_float64(b)
+    # sqrt of the self dot products: the same value np.linalg.norm returns, without its dispatch
+    na = math.sqrt(np.vdot(a, a))
+    nb = math.sqrt(np.vdot(b, b))
     if na < 1e-12 or nb < 1e-12:
         return 0.0
     return float(np.dot(a, b) / (na * nb))
 
 
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k highest scores, best first; ties keep the lower index first
+    (same order as a stable sort on -score).
+    """
+    n = len(scores)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k < n:
+        # Threshold at the k-th largest score; everything tied with it stays a candidate
+        kth = np.partition(scores, n - k)[n - k]
+        cand = np.flatnonzero(scores >= kth)
+    else:
+        cand = np.arange(n)
+    return cand[np.argsort(-scores[cand], kind="stable")][:k]
+
+
 def top_k_similar(
     query_embedding: np.ndarray,
     dish_embeddings: dict[str, dict],
     k: int = 7,
+    dish_index: dict[str, Any] | None = None,
 ) -> list[dict[str, Any]]:
     """
     Return top-k dish_ids by cosine similarity to query_embedding.
     Each item: {"dish_id": str, "similarity": float, "macros": {...}}
+    Scores all dishes with one matrix-vector product over dish_index (from loader.build_dish_index;
+    built on the fly if not given, and kept for repeat calls with the same dish_embeddings).
+    The ids and scores of the last TOPK_CACHE_SIZE distinct (query, k) are kept per dish_index,
+    so a repeated query skips the scan.
+    """
+    if dish_index is None:
+        dish_index = _cached_dish_index(dish_embeddings)
+    ids = dish_index["ids"]
+    if not ids or k <= 0:
+        return []
+    q = _as_float64(query_embedding).ravel()
+    # Exact query bytes, so a hit returns what the scan below would
+    key = (q.tobytes(), k)
+    top = _topk_cache_get(dish_index, key)
+    if top is None:
+        nq = math.sqrt(np.vdot(q, q))
+        if nq < 1e-12:
+            scores = np.zeros(len(ids), dtype=np.float32)
+        else:
+            scores = dish_index["unit"] @ (q / nq).astype(np.float32)
+        top = tuple((ids[i], float(scores[i])) for i in top_k_indices(scores, k))
+        _topk_cache_put(dish_index, key, top)
+    return [
+        {"dish_id": dish_id, "similarity": similarity, "macros": dish_embeddings[dish_id]["macros"]}
+        for dish_id, similarity in top
+    ]
+
+
+def top_k_similar_batch(
+    query_embeddings: list[np.ndarray] | np.ndarray,
+    dish_embeddings: dict[str, dict],
+    k: int = 7,
+    dish_index: dict[str, Any] | None = None,
+) -> list[list[dict[str, Any]]]:
+    """
+    top_k_similar for Q queries at once (e.g. every item of a menu), scoring all of them with one
+    (Q, D) @ (D, M) product. Item b is top_k_similar(query_embeddings[b], ...) up to float32
+    rounding of the scores (the matrix product may sum in a different order than one query's),
+    so dishes scoring within that rounding of each other may come out in either order.
+    Bypasses the top-k cache, so batch scores never mix with single-query ones.
     """
-    dish_ids = list(dish_embeddings.keys())
-    sims = []
-    for did in dish_ids:
-        sim = cosine_sim(query_embedding, dish_embeddings[did]["embedding"])
-        sims.append((did, sim, dish_embeddings[did]["macros"]))
-    sims.sort(key=lambda x: -x[1])
+    if dish_index is None:
+        dish_index = _cached_dish_index(dish_embeddings)
+    ids = dish_index["ids"]
+    Q = len(query_embeddings)
+    if not ids or k <= 0 or Q == 0:
+        return [[] for _ in range(Q)]
+    queries = np.stack([_as_float64(q).ravel() for q in query_embeddings])
+    norms = np.sqrt(np.einsum("qd,qd->q", queries, queries))
+    nonzero = norms >= 1e-12
+    units = np.zeros(queries.shape, dtype=np.float32)
+    units[nonzero] = queries[nonzero] / norms[nonzero, None]
+    scores = units @ dish_index["unit"].T
     return [
-        {"dish_id": did, "similarity": sim, "macros": macros}
-        for did, sim, macros in sims[:k]
+        [
+            {"dish_id": ids[i], "similarity": float(row[i]), "macros": dish_embeddings[ids[i]]["macros"]}
+            for i in top_k_indices(row, k)
+        ]
+        for row in scores
     ]
 
 
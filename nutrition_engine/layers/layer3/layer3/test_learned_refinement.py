@@ -0,0 +1,119 @@
+"""
+Tests for loading the learned refinement model.
+
+A linear model folded with its scaler must predict what the unfolded
+scaler + model pipeline does; anything that cannot be folded is left as is.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("sklearn")
+from sklearn.compose import TransformedTargetRegressor
+from sklearn.linear_model import LinearRegression, Ridge
+from sklearn.preprocessing import MinMaxScaler, StandardScaler
+
+from . import learned_refinement
+from .learned_refinement import MACRO_KEYS, _AffineModel, _fold_linear, load_model
+
+
+def _data(n: int = 60, width: int = 12, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """Features with uneven means and scales, and len(MACRO_KEYS) targets linear in them plus noise."""
+    rng = np.random.default_rng(seed)
+    X = rng.normal(loc=rng.uniform(-50, 50, width), scale=rng.uniform(0.1, 30, width), size=(n, width))
+    y = X @ rng.normal(size=(width, len(MACRO_KEYS))) + rng.normal(scale=0.5, size=(n, len(MACRO_KEYS)))
+    return X, y
+
+
+def _unfolded(model, scaler_X, X: np.ndarray) -> np.ndarray:
+    return np.asarray(model.predict(scaler_X.transform(X) if scaler_X is not None else X))
+
+
+@pytest.mark.parametrize("make_model", [LinearRegression, lambda: Ridge(alpha=2.0)])
+@pytest.mark.parametrize("with_scaler", [True, False])
+def test_fold_linear_matches_pipeline(make_model, with_scaler):
+    """StandardScaler + linear model fold into one _AffineModel with the pipeline's predictions."""
+    X, y = _data()
+    scaler_X = StandardScaler().fit(X) if with_scaler else None
+    model = make_model().fit(scaler_X.transform(X) if scaler_X is not None else X, y)
+
+    folded, folded_scaler = _fold_linear(model, scaler_X)
+    assert isinstance(folded, _AffineModel)
+    assert folded_scaler is None
+
+    X_new, _ = _data(n=25, seed=1)
+    np.testing.assert_allclose(folded.predict(X_new), _unfolded(model, scaler_X, X_new), rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(folded.predict(X_new[:1]), _unfolded(model, scaler_X, X_new[:1]), rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize(
+    "make_scaler, make_model",
+    [
+        # mean_ is fitted but not subtracted, so folding it in would be wrong
+        (lambda: StandardScaler(with_mean=False), LinearRegression),
+        # scale_ multiplies rather than divides, and min_ is not a mean
+        (MinMaxScaler, LinearRegression),
+        # Target scaler (scaler_y): predictions are inverse-transformed, and there is no coef_ to fold
+        (StandardScaler, lambda: TransformedTargetRegressor(LinearRegression(), transformer=StandardScaler())),
+    ],
+)
+def test_fold_linear_falls_back(make_scaler, make_model):
+    """Scalers and models that are not plain standard scaling + linear are returned unfolded."""
+    X, y = _data()
+    scaler_X = make_scaler().fit(X)
+    model = make_model().fit(scaler_X.transform(X), y)
+
+    got_model, got_scaler = _fold_linear(model, scaler_X)
+    assert got_model is model
+    assert got_scaler is scaler_X
+
+
+def test_load_model_folds_joblib_artifact(tmp_path):
+    """load_model folds a {"model", "scaler_X"} joblib artifact; a non-linear one loads unchanged."""
+    joblib = pytest.importorskip("joblib")
+    X, y = _data()
+    scaler_X = StandardScaler().fit(X)
+    model = LinearRegression().fit(scaler_X.transform(X), y)
+    joblib.dump({"model": model, "scaler_X": scaler_X}, tmp_path / "refinement_model.joblib")
+
+    folded, folded_scaler = load_model(tmp_path)
+    assert isinstance(folded, _AffineModel) and folded_scaler is None
+    np.testing.assert_allclose(folded.predict(X), _unfolded(model, scaler_X, X), rtol=1e-9, atol=1e-9)
+
+    scaler_X = MinMaxScaler().fit(X)
+    model = LinearRegression().fit(scaler_X.transform(X), y)
+    joblib.dump({"model": model, "scaler_X": scaler_X}, tmp_path / "refinement_model.joblib")
+    loaded_model, loaded_scaler = load_model(tmp_path)
+    assert not isinstance(loaded_model, _AffineModel) and loaded_scaler is not None
+    np.testing.assert_allclose(
+        _unfolded(loaded_model, loaded_scaler, X), _unfolded(model, scaler_X, X), rtol=1e-12
+    )
+
+    assert load_model(tmp_path / "missing") is None
+
+
+def test_load_model_skips_stale_onnx(tmp_path, monkeypatch, caplog):
+    """The ONNX export wins only while the joblib model has not been retrained after it."""
+    joblib = pytest.importorskip("joblib")
+    X, y = _data()
+    joblib.dump({"model": LinearRegression().fit(X, y), "scaler_X": None}, tmp_path / "refinement_model.joblib")
+    (tmp_path / "refinement_model.onnx").write_bytes(b"onnx")
+    onnx_model = (object(), None)
+    monkeypatch.setattr(learned_refinement, "_load_onnx", lambda path: onnx_model)
+
+    exported = (tmp_path / "refinement_model.onnx").stat().st_mtime_ns
+    os.utime(tmp_path / "refinement_model.joblib", ns=(exported, exported))
+    assert load_model(tmp_path) is onnx_model
+
+    # Retrained after the export
+    os.utime(tmp_path / "refinement_model.joblib", ns=(exported + 10**9, exported + 10**9))
+    with caplog.at_level("WARNING"):
+        model, scaler_X = load_model(tmp_path)
+    assert isinstance(model, _AffineModel) and scaler_X is None
+    assert "refinement_model.joblib" in caplog.text
+
+    # An export shipped without the joblib model is used as it is
+    (tmp_path / "refinement_model.joblib").unlink()
+    assert load_model(tmp_path) is onnx_model
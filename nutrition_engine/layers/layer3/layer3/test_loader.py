@@ -0,0 +1,133 @@
+"""
+Tests for the .npy artifact format.
+
+export_arrays + load_arrays must give back what the pickled artifacts hold.
+"""
+
+import json
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from .loader import ARRAYS_DIRNAME, NeighborIndex, export_arrays, load_all, load_arrays
+
+
+def _write_pickles(artifacts_dir, ids) -> tuple[dict, dict, dict]:
+    """Pickled ingredient, dish and neighbor artifacts; dish and neighbor ids are taken from ids."""
+    rng = np.random.default_rng(3)
+    ingredients = {name: rng.normal(size=8).astype(np.float32) for name in ["rice", "chicken breast", "oil"]}
+    dishes = {
+        d: {
+            "embedding": rng.normal(size=12).astype(np.float32),
+            "macros": {"calories": 100.0 + i, "fat": 5.5, "carbs": 20.0, "protein": 9.0, "sodium": 300.0 * i},
+        }
+        for i, d in enumerate(ids)
+    }
+    dishes[ids[1]]["macros"].pop("sodium")  # missing macro
+    neighbors = {
+        ids[0]: [
+            {"neighbor_id": ids[1], "similarity": 0.9, "macro_deltas": {"calories": 0.1, "fat": -0.25}},
+            {"neighbor_id": ids[2], "similarity": 0.5, "macro_deltas": {"calories": -0.3, "fat": 0.0, "carbs": 0.2,
+                                                                     "protein": 0.05, "sodium": 1.5}},
+            {"neighbor_id": ids[3], "similarity": 0.125, "macro_deltas": {}},
+        ],
+        ids[1]: [{"neighbor_id": ids[0], "similarity": 0.9, "macro_deltas": {"sodium": -0.5}}],  # shorter list
+        ids[2]: [],
+    }
+    for name, obj in [("ingredient_embeddings", ingredients), ("dish_embeddings", dishes), ("neighbor_index", neighbors)]:
+        with open(artifacts_dir / f"{name}.pkl", "wb") as f:
+            pickle.dump(obj, f)
+    return ingredients, dishes, neighbors
+
+
+def test_export_load_round_trip(tmp_path):
+    """Loaded arrays reproduce the pickled ingredients, dishes and neighbor_index."""
+    ingredients, dishes, neighbors = _write_pickles(tmp_path, ["a", "b", "c", "d"])
+    assert export_arrays(tmp_path) == tmp_path / ARRAYS_DIRNAME
+    loaded = load_arrays(tmp_path)
+
+    assert list(loaded["ingredient_embeddings"]) == list(ingredients)
+    for name, emb in ingredients.items():
+        np.testing.assert_array_equal(loaded["ingredient_embeddings"][name], emb)
+
+    assert list(loaded["dish_embeddings"]) == list(dishes)
+    for d, dish in dishes.items():
+        np.testing.assert_array_equal(loaded["dish_embeddings"][d]["embedding"], dish["embedding"])
+        assert loaded["dish_embeddings"][d]["macros"] == dish["macros"]
+    assert loaded["dish_index"]["ids"] == list(dishes)
+
+    index = loaded["neighbor_index"]
+    assert isinstance(index, NeighborIndex)
+    assert list(index) == list(neighbors)
+    assert len(index) == len(neighbors)
+    assert "a" in index and "zzz" not in index
+    for qid, expected in neighbors.items():
+        assert index[qid] == expected
+    with pytest.raises(KeyError):
+        index["zzz"]
+
+
+def test_neighbor_index_repeat_lookups(tmp_path):
+    """Repeated lookups return equal lists (the cached list itself) and stay correct past other keys."""
+    _, _, neighbors = _write_pickles(tmp_path, ["a", "b", "c", "d"])
+    export_arrays(tmp_path)
+    index = load_arrays(tmp_path)["neighbor_index"]
+
+    first = index["a"]
+    assert index["b"] == neighbors["b"]
+    again = index["a"]
+    assert again == first == neighbors["a"]
+    assert again is first
+    assert index.get("zzz") is None
+    assert index.get("a") is first
+
+
+def test_non_str_ids_load_as_str(tmp_path):
+    """Integer ids in the pickles come back as their str form on the array path."""
+    _, dishes, neighbors = _write_pickles(tmp_path, [10, 11, 12, 13])
+    export_arrays(tmp_path)
+    loaded = load_arrays(tmp_path)
+
+    assert list(loaded["dish_embeddings"]) == [str(d) for d in dishes]
+    index = loaded["neighbor_index"]
+    assert list(index) == [str(q) for q in neighbors]
+    assert [n["neighbor_id"] for n in index["10"]] == ["11", "12", "13"]
+    assert 10 not in index
+
+
+def test_empty_neighbor_id_rejected(tmp_path):
+    """An empty neighbor id would read back as padding, so export refuses it."""
+    _write_pickles(tmp_path, ["a", "b", "c", ""])
+    with pytest.raises(ValueError, match="empty neighbor_id"):
+        export_arrays(tmp_path)
+
+
+def test_load_all_skips_stale_arrays(tmp_path, caplog):
+    """load_all maps the arrays only while no source pickle is newer than them."""
+    _, dishes, neighbors = _write_pickles(tmp_path, ["a", "b", "c", "d"])
+    for name in ("macro_delta_stats.json", "confidence_params.json"):
+        (tmp_path / name).write_text(json.dumps({}))
+    export_arrays(tmp_path)
+    exported = min(p.stat().st_mtime_ns for p in (tmp_path / ARRAYS_DIRNAME).iterdir())
+    for name in ("ingredient_embeddings.pkl", "dish_embeddings.pkl", "neighbor_index.pkl"):
+        os.utime(tmp_path / name, ns=(exported, exported))  # as old as the arrays: still current
+
+    assert isinstance(load_all(tmp_path)["neighbor_index"], NeighborIndex)
+
+    # The notebook rebuilt the dishes and neighbors, but convert_artifacts was not rerun
+    dishes["a"]["macros"]["calories"] = 999.0
+    with open(tmp_path / "dish_embeddings.pkl", "wb") as f:
+        pickle.dump(dishes, f)
+    os.utime(tmp_path / "dish_embeddings.pkl", ns=(exported + 10**9, exported + 10**9))
+    with caplog.at_level("WARNING"):
+        loaded = load_all(tmp_path)
+    assert loaded["neighbor_index"] == neighbors
+    assert loaded["dish_embeddings"]["a"]["macros"]["calories"] == 999.0
+    assert "dish_embeddings.pkl" in caplog.text
+
+    # Arrays shipped without their pickles are used as they are
+    for name in ("ingredient_embeddings.pkl", "dish_embeddings.pkl", "neighbor_index.pkl"):
+        (tmp_path / name).unlink()
+    assert isinstance(load_all(tmp_path)["neighbor_index"], NeighborIndex)
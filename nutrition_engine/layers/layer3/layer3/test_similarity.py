@@ -0,0 +1,107 @@
+"""
+Tests for similarity search.
+
+Batched and cached lookups must return what a plain top_k_similar scan does.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from . import similarity
+from .loader import build_dish_index
+
+
+def _dishes(n: int, dim: int = 26, seed: int = 0) -> dict:
+    """n random dishes plus an all-zero embedding and a duplicate of dish 0 (a score tie)."""
+    rng = np.random.default_rng(seed)
+    dishes = {
+        f"d{i}": {"embedding": rng.normal(size=dim).astype(np.float32), "macros": {"calories": float(i)}}
+        for i in range(n)
+    }
+    dishes["zero"] = {"embedding": np.zeros(dim, dtype=np.float32), "macros": {"calories": 0.0}}
+    dishes["dup"] = {"embedding": dishes["d0"]["embedding"].copy(), "macros": {"calories": -1.0}}
+    return dishes
+
+
+@pytest.mark.parametrize("k", [1, 7, 500])
+def test_top_k_similar_batch_matches_single(k):
+    """Each batch row has top_k_similar's ids, similarities and macros, for k above the dish count too."""
+    dishes = _dishes(40)
+    dish_index = build_dish_index(dishes)
+    rng = np.random.default_rng(1)
+    queries = [rng.normal(size=26) for _ in range(5)]
+    queries.append(np.zeros(26))                 # all-zero query: every score is 0
+    queries.append(dishes["d0"]["embedding"])     # ties d0 with dup
+
+    batch = similarity.top_k_similar_batch(queries, dishes, k=k, dish_index=dish_index)
+    assert len(batch) == len(queries)
+    for query, got in zip(queries, batch):
+        expected = similarity.top_k_similar(query, dishes, k=k, dish_index=dish_index)
+        assert len(got) == min(k, len(dishes))
+        np.testing.assert_allclose(
+            [d["similarity"] for d in got], [d["similarity"] for d in expected], atol=1e-6
+        )
+        # Same ids, except that dishes scoring within float32 rounding of each other
+        # (d0 and dup) may swap; each pick must score what the single scan's pick at that rank does
+        single = {
+            d["dish_id"]: d["similarity"]
+            for d in similarity.top_k_similar(query, dishes, k=len(dishes), dish_index=dish_index)
+        }
+        assert len({d["dish_id"] for d in got}) == len(got)
+        for g, e in zip(got, expected):
+            assert g["dish_id"] == e["dish_id"] or abs(single[g["dish_id"]] - e["similarity"]) <= 1e-6
+            assert g["macros"] is dishes[g["dish_id"]]["macros"]
+
+    zero_row = batch[len(queries) - 2]
+    assert all(d["similarity"] == 0.0 for d in zero_row)
+    assert [d["dish_id"] for d in zero_row] == list(dishes)[:min(k, len(dishes))]
+
+
+def test_top_k_similar_batch_empty():
+    """No queries, no dishes or k <= 0 give empty results."""
+    dishes = _dishes(5)
+    assert similarity.top_k_similar_batch([], dishes) == []
+    assert similarity.top_k_similar_batch(np.zeros((2, 26)), dishes, k=0) == [[], []]
+    assert similarity.top_k_similar_batch([np.ones(26)], {}) == [[]]
+
+
+def test_cached_dish_index_tracks_edits():
+    """The on-the-fly index is reused for an unchanged dict and rebuilt when entries are swapped."""
+    dishes = _dishes(10)
+    index = similarity._cached_dish_index(dishes)
+    assert similarity._cached_dish_index(dishes) is index
+
+    # Same size, new embedding for one dish: d3's scores must follow it
+    query = np.ones(26)
+    dishes["d3"] = {"embedding": np.ones(26, dtype=np.float32), "macros": {"calories": 3.0}}
+    top = similarity.top_k_similar(query, dishes, k=1)
+    assert top[0]["dish_id"] == "d3"
+    assert top[0]["similarity"] == pytest.approx(1.0)
+    assert similarity._cached_dish_index(dishes) is not index
+
+    # Same size, one key replaced by another
+    index = similarity._cached_dish_index(dishes)
+    dishes["new"] = dishes.pop("d3")
+    assert similarity.top_k_similar(query, dishes, k=1)[0]["dish_id"] == "new"
+    assert similarity._cached_dish_index(dishes)["ids"] == list(dishes)
+
+
+def test_top_k_similar_threads():
+    """Threads alternating between two on-the-fly indexed dicts each get their own dict's results."""
+    catalogs = [_dishes(30, seed=0), _dishes(30, seed=5)]
+    queries = [np.random.default_rng(i).normal(size=26) for i in range(8)]
+    expected = [
+        [similarity.top_k_similar(q, c, k=5, dish_index=build_dish_index(c)) for q in queries]
+        for c in catalogs
+    ]
+
+    def run(i):
+        c = i % 2
+        q = i % len(queries)
+        got = similarity.top_k_similar(queries[q], catalogs[c], k=5)
+        return [d["dish_id"] for d in got] == [d["dish_id"] for d in expected[c][q]]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        assert all(pool.map(run, range(400)))